@@ -0,0 +1,123 @@
+"""
+Two-stage model cascade
+SimpleCNN answers confident cases; uncertain ones are escalated to the
+BreastCancerCNN in the ECS inference service
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Escalate uncertain images to the ECS model by default (per request with cascade=true)
+CASCADE_ENABLED = os.environ.get("CASCADE_ENABLED", "false").lower() == "true"
+# SimpleCNN probabilities inside [CASCADE_LOW, CASCADE_HIGH] are escalated
+CASCADE_LOW = float(os.environ.get("CASCADE_LOW", "0.3"))
+CASCADE_HIGH = float(os.environ.get("CASCADE_HIGH", "0.7"))
+# Latency samples kept per stage for percentiles
+CASCADE_LATENCY_WINDOW = int(os.environ.get("CASCADE_LATENCY_WINDOW", "1000"))
+
+STAGE1 = "simple_cnn"
+STAGE2 = "breast_cancer_cnn"
+
+
+class CascadeStats:
+    """Thread-safe escalation counters and per-stage latencies."""
+
+    def __init__(self, window: int = CASCADE_LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self.decisions = 0
+        self.escalated = 0
+        self.escalation_failures = 0
+        self._latencies = {STAGE1: deque(maxlen=window), STAGE2: deque(maxlen=window)}
+
+    def record_latency(self, stage: str, seconds: float):
+        with self._lock:
+            self._latencies[stage].append(seconds)
+
+    def record_decision(self, escalated: bool, failed: bool = False):
+        with self._lock:
+            self.decisions += 1
+            self.escalated += int(escalated)
+            self.escalation_failures += int(failed)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            latency = {}
+            for stage, samples in self._latencies.items():
+                values = np.array(samples) * 1000
+                latency[stage] = {
+                    "count": len(values),
+                    "mean": float(values.mean()) if len(values) else None,
+                    "p50": float(np.percentile(values, 50)) if len(values) else None,
+                    "p95": float(np.percentile(values, 95)) if len(values) else None
+                }
+            return {
+                "uncertainty_band": [CASCADE_LOW, CASCADE_HIGH],
+                "decisions": self.decisions,
+                "escalated": self.escalated,
+                "escalation_rate": self.escalated / self.decisions if self.decisions else 0.0,
+                "escalation_failures": self.escalation_failures,
+                "latency_ms": latency
+            }
+
+
+cascade_stats = CascadeStats()
+
+
+def needs_escalation(probability: float, low: float = CASCADE_LOW, high: float = CASCADE_HIGH) -> bool:
+    return low <= probability <= high
+
+
+async def cascade_decision(probability: float, stage1_seconds: float, contents: bytes,
+                           filename: str, content_type: Optional[str] = None) -> Tuple[float, dict]:
+    """
+    Decide an image with the cascade, given the SimpleCNN probability.
+
+    Confident SimpleCNN results are returned as they are. Uncertain ones are
+    sent to the ECS BreastCancerCNN, whose malignant probability becomes the
+    answer. If escalation fails, the SimpleCNN result is kept.
+
+    Returns:
+        The final malignant probability and details of the decision
+    """
+    cascade_stats.record_latency(STAGE1, stage1_seconds)
+    details = {
+        "decided_by": STAGE1,
+        "stage1_probability": probability,
+        "stage1_latency_ms": stage1_seconds * 1000
+    }
+
+    if not needs_escalation(probability):
+        cascade_stats.record_decision(escalated=False)
+        return probability, details
+
+    start = time.perf_counter()
+    try:
+        from app.ecs_predict import ecs_service
+
+        result = await ecs_service.predict_bytes(contents, filename, content_type)
+        stage2_probability = float(result["probabilities"]["malignant"])
+    except Exception as e:
+        logger.error(f"Cascade escalation failed for {filename}: {str(e)}")
+        cascade_stats.record_decision(escalated=True, failed=True)
+        details["escalation_error"] = str(e)
+        return probability, details
+
+    stage2_seconds = time.perf_counter() - start
+    cascade_stats.record_latency(STAGE2, stage2_seconds)
+    cascade_stats.record_decision(escalated=True)
+    logger.info(f"Escalated {filename}: {probability:.3f} -> {stage2_probability:.3f}")
+
+    details.update({
+        "decided_by": STAGE2,
+        "stage2_probability": stage2_probability,
+        "stage2_latency_ms": stage2_seconds * 1000
+    })
+    return stage2_probability, details
@@ -0,0 +1,96 @@
+"""
+TorchScript compilation and warmup for inference models
+"""
+
+import os
+import time
+import logging
+from typing import Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# "none" keeps the eager model, "trace" uses torch.jit.trace, "script" uses torch.jit.script
+MODEL_COMPILE_MODE = os.environ.get("MODEL_COMPILE_MODE", "none").lower()
+# Save the compiled model next to the checkpoint so later cold starts can load it directly
+SAVE_COMPILED_MODEL = os.environ.get("SAVE_COMPILED_MODEL", "true").lower() == "true"
+# Number of forward passes run before the model is handed to the service
+MODEL_WARMUP_BATCHES = int(os.environ.get("MODEL_WARMUP_BATCHES", "1"))
+
+COMPILE_MODES = ("none", "trace", "script")
+
+
+def compiled_model_path(model_path: str, mode: str, variant: str = "") -> str:
+    """Path of the compiled artifact for a checkpoint, e.g. models/best_model.trace.pt"""
+    base, _ = os.path.splitext(model_path)
+    suffix = f".{variant}" if variant else ""
+    return f"{base}{suffix}.{mode}.pt"
+
+
+def compile_model(model: torch.nn.Module, mode: str, example_input: torch.Tensor) -> torch.nn.Module:
+    """
+    Compile an eval-mode model with TorchScript and freeze it for inference.
+
+    Args:
+        model: Model to compile
+        mode: "trace" or "script"
+        example_input: Representative input batch, used for tracing
+
+    Returns:
+        Frozen TorchScript module
+    """
+    model.eval()
+    with torch.no_grad():
+        if mode == "trace":
+            compiled = torch.jit.trace(model, example_input)
+        elif mode == "script":
+            compiled = torch.jit.script(model)
+        else:
+            raise ValueError(f"Unknown compile mode: {mode} (expected one of {COMPILE_MODES})")
+    return torch.jit.freeze(compiled.eval())
+
+
+def load_compiled_model(path: str, model_path: str) -> Optional[torch.nn.Module]:
+    """Load a saved compiled model if it exists and is newer than its checkpoint."""
+    if not os.path.exists(path):
+        return None
+    if os.path.exists(model_path) and os.path.getmtime(path) < os.path.getmtime(model_path):
+        logger.info(f"Compiled model {path} is older than {model_path}, recompiling")
+        return None
+    try:
+        compiled = torch.jit.load(path, map_location=torch.device("cpu"))
+        logger.info(f"Loaded compiled model from {path}")
+        return compiled.eval()
+    except Exception as e:
+        logger.warning(f"Could not load compiled model {path}: {e}")
+        return None
+
+
+def save_compiled_model(compiled: torch.nn.Module, path: str) -> bool:
+    """Save a compiled model, tolerating read-only filesystems (e.g. Lambda)."""
+    try:
+        torch.jit.save(compiled, path)
+        logger.info(f"Saved compiled model to {path}")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not save compiled model to {path}: {e}")
+        return False
+
+
+def warmup_model(model: torch.nn.Module, example_input: torch.Tensor, batches: int = MODEL_WARMUP_BATCHES) -> float:
+    """
+    Run a few forward passes so allocator and kernel setup happens before the first request.
+
+    Returns:
+        Total warmup time in seconds
+    """
+    if batches <= 0:
+        return 0.0
+    start = time.perf_counter()
+    with torch.no_grad():
+        for _ in range(batches):
+            model(example_input)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Model warmup complete: {batches} batches in {elapsed * 1000:.1f} ms")
+    return elapsed
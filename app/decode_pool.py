@@ -0,0 +1,243 @@
+"""
+Process-pool image decoding
+Decodes large batches and slide regions in worker processes, returning pixels through memory-mapped files
+"""
+
+import io
+import os
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from app.image_utils import ImageProbe, decode_image, decode_stats
+from app.tiling import load_region, probe_region
+from app.tissue_filter import filter_tissue
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for decoding (0 disables the pool; everything is decoded in-process)
+DECODE_PROCESSES = int(os.environ.get("DECODE_PROCESSES", "0"))
+# Images decoded per task sent to a worker
+DECODE_CHUNK_SIZE = int(os.environ.get("DECODE_CHUNK_SIZE", "8"))
+# Batches with fewer distinct images are decoded in-process, where there is no IPC overhead
+DECODE_POOL_MIN_BATCH = int(os.environ.get("DECODE_POOL_MIN_BATCH", "16"))
+# Directory of the files workers write decoded pixels into; a tmpfs such as /dev/shm keeps them in memory
+DECODE_BUFFER_DIR = os.environ.get("DECODE_BUFFER_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+
+def _create_buffer(shape: tuple) -> str:
+    """Create a zero-filled file the size of a uint8 array of ``shape`` and return its path."""
+    fd, path = tempfile.mkstemp(prefix="decode-", dir=DECODE_BUFFER_DIR)
+    try:
+        os.ftruncate(fd, int(np.prod(shape)))
+    except OSError:
+        os.close(fd)
+        os.unlink(path)
+        raise
+    os.close(fd)
+    return path
+
+
+def _decode_chunk(path: str, shape: tuple, start: int, items: list, target_size: tuple) -> list:
+    """Worker: decode ``items`` into rows ``start``.. of the [N, H, W, 3] array in ``path``."""
+    pixels = np.memmap(path, dtype=np.uint8, mode="r+", shape=shape)
+    results = []
+    for offset, (contents, filename) in enumerate(items):
+        try:
+            decoded = decode_image(contents, filename, target_size=target_size)
+            pixels[start + offset] = decoded.pixels
+            results.append(decoded.timings)
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _decode_region(path: str, shape: tuple, contents: bytes, filename: str, patch_size: int):
+    """Worker: decode a region the caller has already probed and scale it into the [H, W, 3] array in ``path``."""
+    region = np.memmap(path, dtype=np.uint8, mode="r+", shape=shape)
+    # Budgets were enforced on the caller's probe; this only opens the image to decode it
+    probe = ImageProbe(Image.open(io.BytesIO(contents)), len(contents), None)
+    region[:] = load_region(contents, filename, patch_size, probe=probe, scaled_size=(shape[1], shape[0]))
+
+
+class DecodePool:
+    """
+    Decodes images in worker processes, where PIL does not contend for
+    this process's GIL.
+
+    Callers are threads of the prediction executor; they block on the
+    workers without holding the GIL. Workers write decoded uint8 pixels
+    into a file in DECODE_BUFFER_DIR that the caller memory-maps, so only
+    the encoded bytes are pickled, never the pixels. The file is unlinked
+    as soon as the workers are done; the returned arrays keep the mapping
+    alive and are used in place, without copying. The pool is started on
+    first use with the ``spawn`` start method, so workers never inherit
+    model threads. Small batches, and any failure to start or use the pool,
+    fall back to decoding in-process.
+    """
+
+    def __init__(self, processes: int = DECODE_PROCESSES, chunk_size: int = DECODE_CHUNK_SIZE,
+                 min_batch: int = DECODE_POOL_MIN_BATCH):
+        self.processes = processes
+        self.chunk_size = max(1, chunk_size)
+        self.min_batch = min_batch
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._disabled = processes <= 0
+        self.pooled_images = 0
+        self.pooled_regions = 0
+        self.in_process_images = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return not self._disabled
+
+    def use_for(self, count: int) -> bool:
+        """Whether a batch of ``count`` distinct images is worth sending to the pool."""
+        return self.enabled and count >= self.min_batch
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        with self._lock:
+            if self._pool is None and not self._disabled:
+                try:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+                    logger.info(f"Decode pool started: {self.processes} processes, chunk size {self.chunk_size}")
+                except Exception as e:
+                    logger.warning(f"Decode pool unavailable, decoding in-process: {e}")
+                    self._disabled = True
+            return self._pool
+
+    def _discard_pool(self, error: Exception):
+        """Drop a broken pool; the next call starts a fresh one."""
+        logger.error(f"Decode pool failed, decoding in-process: {error}")
+        with self._lock:
+            self.failures += 1
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def decode_batch(self, contents_list: Sequence[bytes], filenames: Sequence[str],
+                     target_size: tuple) -> List[Union[np.ndarray, Exception]]:
+        """
+        Decode and resize uploads to ``target_size``.
+
+        Returns:
+            One uint8 [H, W, 3] array per upload, or the exception that
+            decoding it raised (e.g. ValueError for an invalid image)
+        """
+        pool = self._get_pool() if len(contents_list) >= self.min_batch else None
+        if pool is not None:
+            try:
+                return self._decode_batch_pooled(pool, contents_list, filenames, target_size)
+            except Exception as e:
+                self._discard_pool(e)
+
+        results = []
+        for contents, filename in zip(contents_list, filenames):
+            try:
+                results.append(decode_image(contents, filename, target_size=target_size).pixels)
+            except Exception as e:
+                results.append(e)
+        with self._lock:
+            self.in_process_images += len(results)
+        return results
+
+    def prepare_batch(self, contents_list: Sequence[bytes], filenames: Sequence[str],
+                      target_size: tuple) -> list:
+        """``decode_batch`` followed by the tissue filter, as ``app.tissue_filter.prepare_pixels`` does for one upload."""
+        return [
+            item if isinstance(item, Exception) else filter_tissue(item)
+            for item in self.decode_batch(contents_list, filenames, target_size)
+        ]
+
+    def _decode_batch_pooled(self, pool, contents_list, filenames, target_size) -> list:
+        shape = (len(contents_list), target_size[1], target_size[0], 3)
+        path = _create_buffer(shape)
+        try:
+            items = list(zip(contents_list, filenames))
+            futures = [
+                pool.submit(_decode_chunk, path, shape, start, items[start:start + self.chunk_size], target_size)
+                for start in range(0, len(items), self.chunk_size)
+            ]
+            outcomes = [outcome for future in futures for outcome in future.result()]
+            pixels = np.memmap(path, dtype=np.uint8, mode="r+", shape=shape)
+        finally:
+            # The mapping outlives the name, so nothing is left behind however the call ends
+            os.unlink(path)
+
+        results = []
+        for index, outcome in enumerate(outcomes):
+            if isinstance(outcome, Exception):
+                results.append(outcome)
+            else:
+                decode_stats.record(outcome)
+                # Rows are views of the mapping, which is released with the last of them
+                results.append(np.asarray(pixels[index]))
+        with self._lock:
+            self.pooled_images += len(contents_list)
+        return results
+
+    def load_region(self, contents: bytes, filename: str, patch_size: int, probe: Optional[ImageProbe] = None,
+                    scaled_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """Same as ``app.tiling.load_region``, decoded in a worker process when the pool is enabled."""
+        if probe is None:
+            # Budgets are checked from the header, before the scaled region is allocated
+            probe, scaled_size = probe_region(contents, filename, patch_size)
+        pool = self._get_pool()
+        if pool is None:
+            return load_region(contents, filename, patch_size, probe=probe, scaled_size=scaled_size)
+
+        scaled_width, scaled_height = scaled_size
+        shape = (scaled_height, scaled_width, 3)
+        path = _create_buffer(shape)
+        try:
+            try:
+                pool.submit(_decode_region, path, shape, contents, filename, patch_size).result()
+            except ValueError:
+                raise
+            except Exception as e:
+                self._discard_pool(e)
+                return load_region(contents, filename, patch_size, probe=probe, scaled_size=scaled_size)
+            region = np.memmap(path, dtype=np.uint8, mode="r+", shape=shape)
+        finally:
+            os.unlink(path)
+        with self._lock:
+            self.pooled_regions += 1
+        # The caller owns the mapping from here; it is released with the array
+        return np.asarray(region)
+
+    def shutdown(self):
+        """Stop the worker processes; later calls decode in-process."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._disabled = True
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+            logger.info("Decode pool stopped")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "processes": self.processes,
+                "chunk_size": self.chunk_size,
+                "min_batch": self.min_batch,
+                "pooled_images": self.pooled_images,
+                "pooled_regions": self.pooled_regions,
+                "in_process_images": self.in_process_images,
+                "failures": self.failures
+            }
+
+
+decode_pool = DecodePool()
+
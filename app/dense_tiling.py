@@ -0,0 +1,122 @@
+"""
+Dense sliding-window inference
+Scores every window of a slide region with the fully-convolutional SimpleCNN
+"""
+
+import os
+import logging
+from typing import Tuple
+
+import numpy as np
+import torch
+
+from app.model import FullyConvolutionalSimpleCNN
+
+logger = logging.getLogger(__name__)
+
+# Input pixels processed per band; bounds activation memory for any region width
+DENSE_BAND_PIXELS = int(os.environ.get("DENSE_BAND_PIXELS", "500000"))
+# Windows re-scored individually to measure how far dense results deviate (0 disables)
+DENSE_VERIFY_WINDOWS = int(os.environ.get("DENSE_VERIFY_WINDOWS", "16"))
+
+# Context rows added above and below each band so its features equal those of
+# a single pass over the whole region (three 3x3 convolutions reach 7 pixels)
+BAND_HALO = 8
+
+
+class DenseRegionScorer:
+    """
+    Scores all windows of a region with shared convolution features.
+
+    The region is processed in horizontal bands of at most ``band_pixels``
+    input pixels. Each band carries a halo of context rows, so the result is
+    the same as one forward pass over the whole region, without its memory.
+
+    Window logits are exact for the features they are given, but inside a
+    region a window's border pixels see their neighbours through the 3x3
+    padding instead of zeros, so probabilities differ slightly from scoring
+    the same window as an isolated patch. ``verify_windows`` of them are
+    re-scored in isolation on every call and the largest difference reported.
+    """
+
+    def __init__(self, model: FullyConvolutionalSimpleCNN, band_pixels: int = DENSE_BAND_PIXELS,
+                 verify_windows: int = DENSE_VERIFY_WINDOWS):
+        self.model = model
+        self.band_pixels = band_pixels
+        self.verify_windows = verify_windows
+        # Window strides must be whole feature map cells
+        self.alignment = model.cell
+
+    def logit_map(self, region: np.ndarray, stride: int) -> torch.Tensor:
+        """
+        Logits of every window at ``stride`` pixels (a multiple of ``alignment``).
+
+        Args:
+            region: uint8 array of shape [H, W, 3]
+
+        Returns:
+            Logits of shape [rows, cols]
+        """
+        window, cell = self.model.window, self.model.cell
+        cell_stride = stride // cell
+        height, width = region.shape[:2]
+        rows = (height - window) // stride + 1
+        cols = (width - window) // stride + 1
+
+        # Window rows per band, rounded to the stride so band starts stay on the window grid
+        band_rows = max(1, (self.band_pixels // width - window - 2 * BAND_HALO) // stride + 1)
+
+        bands = []
+        with torch.no_grad():
+            for first in range(0, rows, band_rows):
+                last = min(rows, first + band_rows)  # exclusive
+                y0 = first * stride
+                top = max(0, y0 - BAND_HALO)
+                bottom = min(height, (last - 1) * stride + window + BAND_HALO)
+
+                x = torch.from_numpy(np.ascontiguousarray(region[top:bottom])).permute(2, 0, 1)
+                x = x.unsqueeze(0).float().div_(255.0)
+                features = self.model.features(x)
+
+                # Drop the halo cells; keep exactly the cells the band's windows cover
+                skip = (y0 - top) // cell
+                span = (last - first - 1) * cell_stride + window // cell
+                features = features[:, :, skip:skip + span]
+                bands.append(self.model.classify(features, cell_stride)[0, :, :cols])
+
+        return torch.cat(bands, dim=0)
+
+    def verify(self, region: np.ndarray, stride: int, probabilities: np.ndarray) -> dict:
+        """Re-score a sample of windows as isolated patches and compare."""
+        rows, cols = probabilities.shape
+        count = min(self.verify_windows, rows * cols)
+        if count == 0:
+            return {"windows_checked": 0}
+
+        window = self.model.window
+        indices = np.linspace(0, rows * cols - 1, count).astype(int)
+        patches = np.stack([
+            region[(i // cols) * stride:(i // cols) * stride + window, (i % cols) * stride:(i % cols) * stride + window]
+            for i in indices
+        ])
+        x = torch.from_numpy(patches).permute(0, 3, 1, 2).float().div_(255.0)
+        with torch.no_grad():
+            isolated = torch.sigmoid(self.model(x).reshape(-1)).numpy()
+
+        return {
+            "windows_checked": int(count),
+            "max_probability_difference": float(np.abs(isolated - probabilities.reshape(-1)[indices]).max())
+        }
+
+    def __call__(self, region: np.ndarray, window: int, stride: int) -> Tuple[np.ndarray, dict]:
+        """
+        Probability heatmap for every ``window`` patch at ``stride`` pixels.
+
+        Returns:
+            Heatmap of shape [rows, cols] and verification details
+        """
+        if window != self.model.window or stride % self.alignment:
+            raise ValueError(f"Dense scoring needs {self.model.window}px windows and a stride that is a multiple of {self.alignment}")
+
+        probabilities = torch.sigmoid(self.logit_map(region, stride)).numpy()
+        return probabilities, self.verify(region, stride, probabilities)
@@ -24,19 +24,25 @@ class ECSPredictionService:
         """
         Send prediction request to ECS service
         """
+        # Read file content
+        file_content = await file.read()
+        
+        # Reset file pointer for potential reuse
+        file.file.seek(0)
+        
+        return await self.predict_bytes(file_content, file.filename, file.content_type)
+    
+    async def predict_bytes(self, file_content: bytes, filename: str, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Send already-read image bytes to the ECS service
+        """
         try:
-            # Read file content
-            file_content = await file.read()
-            
-            # Reset file pointer for potential reuse
-            file.file.seek(0)
-            
             # Prepare multipart form data
             data = aiohttp.FormData()
             data.add_field('file', 
                           file_content, 
-                          filename=file.filename,
-                          content_type=file.content_type)
+                          filename=filename,
+                          content_type=content_type)
             
             # Make request to ECS service
             timeout = aiohttp.ClientTimeout(total=self.timeout)
@@ -0,0 +1,105 @@
+"""
+Bounded executors for blocking work in the prediction path
+Keeps image decoding, model inference and boto3 calls off the event loop
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Threads for CPU-bound work (decode, transforms, forward pass)
+INFERENCE_THREADS = int(os.environ.get("INFERENCE_THREADS", "2"))
+# Threads for blocking I/O (S3 uploads)
+IO_THREADS = int(os.environ.get("IO_THREADS", "4"))
+# Maximum number of requests allowed in the CPU-bound stage at once
+MAX_CONCURRENT_PREDICTIONS = int(os.environ.get("MAX_CONCURRENT_PREDICTIONS", str(INFERENCE_THREADS * 2)))
+
+
+class PredictionExecutor:
+    """
+    Runs blocking functions on bounded thread pools and limits how many
+    predictions are in flight at the same time.
+
+    CPU work and I/O use separate pools so a slow S3 upload never occupies
+    a thread that could be running inference.
+    """
+
+    def __init__(self, cpu_workers: int, io_workers: int, max_concurrency: int):
+        self.cpu_workers = max(1, cpu_workers)
+        self.io_workers = max(1, io_workers)
+        self.max_concurrency = max(1, max_concurrency)
+        self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="predict-cpu")
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="predict-io")
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        self._completed = 0
+        self._peak_in_flight = 0
+        logger.info(
+            f"PredictionExecutor initialized: cpu_workers={self.cpu_workers}, "
+            f"io_workers={self.io_workers}, max_concurrency={self.max_concurrency}"
+        )
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the event loop that actually serves requests
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def limit(self):
+        """Hold one of the ``max_concurrency`` prediction slots for the duration of the block."""
+        semaphore = self._get_semaphore()
+        with self._lock:
+            self._waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        with self._lock:
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+            semaphore.release()
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a CPU-bound function on the inference pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._cpu_pool, functools.partial(func, *args, **kwargs))
+
+    async def run_io(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking I/O function (e.g. boto3) on the I/O pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._io_pool, functools.partial(func, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        """Current pool configuration and concurrency counters."""
+        with self._lock:
+            return {
+                "cpu_workers": self.cpu_workers,
+                "io_workers": self.io_workers,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "peak_in_flight": self._peak_in_flight,
+                "completed": self._completed
+            }
+
+
+# Global instance
+prediction_executor = PredictionExecutor(INFERENCE_THREADS, IO_THREADS, MAX_CONCURRENT_PREDICTIONS)
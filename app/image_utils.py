@@ -4,142 +4,257 @@ Image processing utilities with enhanced error handling and debugging
 
 from PIL import Image
 import io
+import os
+import time
 import logging
+import threading
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# When resizing for the model, large JPEGs are decoded at reduced resolution, keeping at
+# least this multiple of the target size (0 always decodes at full resolution)
+IMAGE_DRAFT_OVERSAMPLE = int(os.environ.get("IMAGE_DRAFT_OVERSAMPLE", "4"))
+# Largest upload accepted, in bytes
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", str(25 * 1024 * 1024)))
+# Largest image decoded, in pixels, checked from the header before any pixel data is read
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", "40000000"))
+
+# File signatures used to name the format in logs and errors
+FILE_SIGNATURES = {
+    'PNG': b'\x89PNG\r\n\x1a\n',
+    'JPEG': b'\xff\xd8\xff',
+    'GIF87a': b'GIF87a',
+    'GIF89a': b'GIF89a',
+    'BMP': b'BM',
+    'WEBP': b'RIFF'
+}
+
+DECODE_STAGES = ("probe", "decode", "convert", "resize")
+
+def detect_format(file_contents: bytes):
+    """Format named by the file signature, or None"""
+    for format_name, signature in FILE_SIGNATURES.items():
+        if file_contents.startswith(signature):
+            return format_name
+    return None
+
+class ImageTooLargeError(ValueError):
+    """The upload exceeds the byte or pixel budget"""
+
+class ImageProbe:
+    """
+    What the header says about an upload: format, dimensions, mode and frame
+    count. Holds the opened, not yet decoded image so decoding does not
+    parse the header again.
+    """
+
+    def __init__(self, image: Image.Image, byte_size: int, detected_format):
+        self.image = image
+        self.byte_size = byte_size
+        self.format = image.format or detected_format
+        self.size = image.size
+        self.mode = image.mode
+        self.frames = getattr(image, "n_frames", 1)
+
+    @property
+    def pixels(self) -> int:
+        return self.size[0] * self.size[1]
+
+    @property
+    def decode_size(self) -> tuple:
+        """Dimensions that decoding will produce (smaller than ``size`` for a JPEG draft)"""
+        return self.image.size
+
+    def as_dict(self) -> dict:
+        return {
+            "format": self.format,
+            "width": self.size[0],
+            "height": self.size[1],
+            "mode": self.mode,
+            "frames": self.frames,
+            "bytes": self.byte_size
+        }
+
+def probe_image(file_contents: bytes, filename: str = "unknown", target_size: tuple = None,
+                max_bytes: int = IMAGE_MAX_BYTES, max_pixels: int = IMAGE_MAX_PIXELS) -> ImageProbe:
+    """
+    Read only the image header and enforce the byte and pixel budgets.
+
+    With ``target_size``, large JPEGs are set up for reduced-resolution
+    decoding first, so the pixel budget applies to what will actually be
+    decoded: a huge JPEG headed for the model is decoded small rather than
+    rejected.
+
+    Raises:
+        ImageTooLargeError: If the upload exceeds ``max_bytes`` or would decode
+            to more than ``max_pixels`` pixels
+        ValueError: If the header cannot be read
+    """
+    if len(file_contents) == 0:
+        raise ValueError("Empty file received")
+    if len(file_contents) > max_bytes:
+        raise ImageTooLargeError(f"Image file too large: {len(file_contents)} bytes (maximum {max_bytes})")
+
+    detected_format = detect_format(file_contents)
+    try:
+        image = Image.open(io.BytesIO(file_contents))
+    except Image.DecompressionBombError as bomb_error:
+        raise ImageTooLargeError(f"Image too large: {bomb_error}")
+    except Exception as open_error:
+        logger.error(f"Cannot open {filename} ({detected_format or 'unknown format'}): {open_error}")
+        logger.error(f"Raw data sample (first 50 bytes): {file_contents[:50]}")
+        raise ValueError(f"Cannot open image file: {open_error}")
+    probe = ImageProbe(image, len(file_contents), detected_format)
+
+    width, height = probe.size
+    if width < 1 or height < 1:
+        raise ValueError(f"Invalid image dimensions: {width}x{height}")
+
+    if target_size is not None and IMAGE_DRAFT_OVERSAMPLE > 0 and image.format == 'JPEG':
+        # Only picks a smaller DCT scale while the result stays at least this size
+        image.draft('RGB', (target_size[0] * IMAGE_DRAFT_OVERSAMPLE, target_size[1] * IMAGE_DRAFT_OVERSAMPLE))
+
+    decode_width, decode_height = probe.decode_size
+    if decode_width * decode_height > max_pixels:
+        raise ImageTooLargeError(f"Image too large: {width}x{height} (maximum {max_pixels} pixels)")
+    return probe
+
+class DecodedImage:
+    """Result of decoding one upload: the RGB image, optional model-sized pixels and stage timings"""
+
+    def __init__(self, image: Image.Image, pixels, probe: ImageProbe, timings: dict):
+        self.image = image
+        self.pixels = pixels
+        self.probe = probe
+        self.source_format = probe.format
+        self.source_mode = probe.mode
+        self.source_size = probe.size
+        self.timings = timings
+
+    @property
+    def size(self) -> tuple:
+        return self.image.size
+
+class DecodeStats:
+    """Thread-safe running totals of decode stage timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.totals = {stage: 0.0 for stage in DECODE_STAGES}
+
+    def record(self, timings: dict):
+        with self._lock:
+            self.count += 1
+            for stage in DECODE_STAGES:
+                self.totals[stage] += timings.get(f"{stage}_ms", 0.0)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "images": self.count,
+                "mean_ms": {
+                    stage: total / self.count if self.count else 0.0
+                    for stage, total in self.totals.items()
+                }
+            }
+
+decode_stats = DecodeStats()
+
+def decode_image(file_contents: bytes, filename: str = "unknown", target_size: tuple = None,
+                 probe: ImageProbe = None) -> DecodedImage:
+    """
+    Decode an upload exactly once: probe the header, decode the pixels,
+    convert to RGB and, when ``target_size`` is given, resize to the model
+    input in the same pass.
+
+    When resizing, JPEGs much larger than the target are decoded at 1/2,
+    1/4 or 1/8 size with DCT scaling (``Image.draft``), keeping at least
+    ``IMAGE_DRAFT_OVERSAMPLE`` times the target size, which cuts decode time
+    and peak memory. Model inputs then differ from a full-resolution decode
+    by a grey level or two. ``image`` is the reduced image; ``source_size``
+    is the original size.
+
+    Args:
+        file_contents: Raw bytes from uploaded file
+        filename: Original filename for logging
+        target_size: Model input size as (width, height), or None to skip resizing
+        probe: Result of ``probe_image`` for these bytes, if the caller already
+            probed them (e.g. to apply its own budget); it must not have been decoded
+
+    Returns:
+        DecodedImage with per-stage timings in milliseconds
+
+    Raises:
+        ImageTooLargeError: If the image exceeds the byte or pixel budget
+        ValueError: If the image cannot be decoded
+    """
+    timings = {}
+
+    stage_start = time.perf_counter()
+    if probe is None:
+        probe = probe_image(file_contents, filename, target_size)
+    image = probe.image
+    timings["probe_ms"] = (time.perf_counter() - stage_start) * 1000
+
+    stage_start = time.perf_counter()
+    try:
+        # Decoding every pixel also verifies that the data is complete
+        image.load()
+    except Exception as decode_error:
+        logger.error(f"Cannot decode {filename}: {decode_error}")
+        raise ValueError(f"Image data appears corrupted: {decode_error}")
+    timings["decode_ms"] = (time.perf_counter() - stage_start) * 1000
+
+    stage_start = time.perf_counter()
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    timings["convert_ms"] = (time.perf_counter() - stage_start) * 1000
+
+    pixels = None
+    if target_size is not None:
+        stage_start = time.perf_counter()
+        pixels = resize_to_pixels(image, target_size)
+        timings["resize_ms"] = (time.perf_counter() - stage_start) * 1000
+
+    timings["total_ms"] = sum(timings.values())
+    decode_stats.record(timings)
+    logger.info(
+        f"Decoded {filename}: {probe.format} {probe.size[0]}x{probe.size[1]} {probe.mode} "
+        f"at {image.size[0]}x{image.size[1]}, {timings['total_ms']:.1f} ms"
+    )
+    return DecodedImage(image, pixels, probe, timings)
+
 def process_uploaded_image(file_contents: bytes, filename: str = "unknown") -> Image.Image:
     """
-    Process uploaded image data with comprehensive error handling and debugging
-    
+    Decode uploaded image data into an RGB PIL Image
+
     Args:
         file_contents: Raw bytes from uploaded file
-        filename: Original filename for debugging
-        
+        filename: Original filename for logging
+
     Returns:
         PIL Image object converted to RGB
-        
+
     Raises:
         ValueError: If image cannot be processed
     """
     try:
-        # Log basic file information
-        logger.info(f"Processing uploaded image: {filename}")
-        logger.info(f"File size: {len(file_contents)} bytes")
-        
-        # Check if file is empty
-        if len(file_contents) == 0:
-            raise ValueError("Empty file received")
-            
-        # Log first few bytes for debugging (safe for logging)
-        first_bytes = file_contents[:20] if len(file_contents) >= 20 else file_contents
-        logger.info(f"First 20 bytes: {first_bytes}")
-        
-        # Check file signatures to identify format
-        file_signatures = {
-            'PNG': b'\x89PNG\r\n\x1a\n',
-            'JPEG': b'\xff\xd8\xff',
-            'GIF87a': b'GIF87a',
-            'GIF89a': b'GIF89a', 
-            'BMP': b'BM',
-            'WEBP': b'RIFF'
-        }
-        
-        detected_format = None
-        for format_name, signature in file_signatures.items():
-            if file_contents.startswith(signature):
-                detected_format = format_name
-                break
-                
-        logger.info(f"Detected image format: {detected_format or 'Unknown'}")
-        
-        if not detected_format:
-            logger.warning("Unknown image format - attempting to process anyway")
-            
-        # Multiple attempts to open the image with different strategies
-        image = None
-        attempts = [
-            # Strategy 1: Direct BytesIO approach
-            lambda: _attempt_image_open_direct(file_contents),
-            # Strategy 2: Reset stream position
-            lambda: _attempt_image_open_with_reset(file_contents),
-            # Strategy 3: Copy data to new BytesIO
-            lambda: _attempt_image_open_copy(file_contents),
-        ]
-        
-        last_error = None
-        for i, attempt_func in enumerate(attempts, 1):
-            try:
-                logger.info(f"Attempting image open strategy {i}/3")
-                image = attempt_func()
-                logger.info(f"Success with strategy {i}")
-                break
-            except Exception as attempt_error:
-                logger.warning(f"Strategy {i} failed: {attempt_error}")
-                last_error = attempt_error
-                continue
-                
-        if image is None:
-            logger.error(f"All image opening strategies failed. Last error: {last_error}")
-            logger.error(f"Raw data sample (first 50 bytes): {file_contents[:50]}")
-            raise ValueError(f"Cannot open image file after {len(attempts)} attempts. Last error: {last_error}")
-            
-        # Convert to RGB mode
-        if image.mode != 'RGB':
-            logger.info(f"Converting from {image.mode} to RGB")
-            image = image.convert('RGB')
-        else:
-            logger.info("Image already in RGB mode")
-            
-        # Final validation - try to access pixel data
-        try:
-            width, height = image.size
-            # Try to get a pixel to ensure image data is accessible
-            pixel = image.getpixel((0, 0))
-            logger.info(f"Image processing successful: {width}x{height}, sample pixel: {pixel}")
-            
-        except Exception as pixel_error:
-            logger.error(f"Cannot access image pixel data: {pixel_error}")
-            raise ValueError(f"Image data appears corrupted: {pixel_error}")
-            
-        return image
-            
+        return decode_image(file_contents, filename).image
     except ValueError:
-        # Re-raise ValueError as-is
         raise
     except Exception as unexpected_error:
         logger.error(f"Unexpected error processing image: {unexpected_error}")
         raise ValueError(f"Unexpected image processing error: {unexpected_error}")
 
-def _attempt_image_open_direct(file_contents: bytes) -> Image.Image:
-    """Attempt 1: Direct BytesIO approach"""
-    image_stream = io.BytesIO(file_contents)
-    image = Image.open(image_stream)
-    # Load the image to ensure it's valid
-    image.load()
-    return image
-
-def _attempt_image_open_with_reset(file_contents: bytes) -> Image.Image:
-    """Attempt 2: BytesIO with explicit reset"""
-    image_stream = io.BytesIO(file_contents)
-    image_stream.seek(0)  # Ensure we're at the beginning
-    image = Image.open(image_stream)
-    image.load()
-    return image
-
-def _attempt_image_open_copy(file_contents: bytes) -> Image.Image:
-    """Attempt 3: Copy to new BytesIO stream"""
-    # Create a fresh copy of the data
-    image_data = bytes(file_contents)  # Make a copy
-    image_stream = io.BytesIO(image_data)
-    image = Image.open(image_stream)
-    image.load()
-    return image
-
 def validate_image_for_model(image: Image.Image, target_size: tuple = (64, 64)) -> bool:
     """
     Validate that an image is suitable for model processing
     
+    Only the mode and dimensions are checked; the image is resized once,
+    when the model input is produced.
+    
     Args:
         image: PIL Image object
         target_size: Expected target size for model input
@@ -150,26 +265,38 @@ def validate_image_for_model(image: Image.Image, target_size: tuple = (64, 64))
     Raises:
         ValueError: If image is not suitable for processing
     """
-    try:
-        # Check image mode
-        if image.mode != 'RGB':
-            raise ValueError(f"Image must be in RGB mode, got {image.mode}")
-            
-        # Check image size
-        width, height = image.size
-        if width < 1 or height < 1:
-            raise ValueError(f"Invalid image dimensions: {width}x{height}")
-            
-        # Check if image can be resized to target size
-        try:
-            test_resize = image.resize(target_size)
-            logger.info(f"Image validation successful: can resize from {image.size} to {target_size}")
-            return True
-            
-        except Exception as resize_error:
-            raise ValueError(f"Cannot resize image to {target_size}: {resize_error}")
-            
-    except ValueError:
-        raise
-    except Exception as e:
-        raise ValueError(f"Image validation failed: {e}")
\ No newline at end of file
+    if image.mode != 'RGB':
+        raise ValueError(f"Image must be in RGB mode, got {image.mode}")
+        
+    width, height = image.size
+    if width < 1 or height < 1:
+        raise ValueError(f"Invalid image dimensions: {width}x{height}")
+    return True
+
+def resize_to_pixels(image: Image.Image, target_size: tuple = (64, 64)) -> np.ndarray:
+    """
+    Resize an RGB image as transforms.Resize does (bilinear) and return its
+    pixels as a writable uint8 array of shape [height, width, 3]
+    """
+    return np.array(image.resize(target_size, Image.BILINEAR), dtype=np.uint8)
+
+def image_to_array(image: Image.Image, target_size: tuple = (64, 64)) -> np.ndarray:
+    """
+    Convert an RGB image into a model input array without torchvision
+    
+    Matches transforms.Resize + transforms.ToTensor: bilinear resize, then
+    scale to [0, 1] in channel-first layout.
+    
+    Args:
+        image: PIL Image object in RGB mode
+        target_size: Model input size as (width, height)
+        
+    Returns:
+        float32 array of shape [3, height, width]
+    """
+    return pixels_to_array(resize_to_pixels(image, target_size))
+
+def pixels_to_array(pixels: np.ndarray) -> np.ndarray:
+    """uint8 [H, W, 3] pixels to a float32 [3, H, W] array scaled to [0, 1]"""
+    array = pixels.astype(np.float32) / 255.0
+    return np.ascontiguousarray(array.transpose(2, 0, 1))
@@ -0,0 +1,66 @@
+"""
+Torch-free prediction routes
+Serves real SimpleCNN predictions with only NumPy and a lightweight runtime
+"""
+
+from fastapi import APIRouter
+from typing import List, Tuple
+import logging
+
+import numpy as np
+
+from app.prediction_routes import create_prediction_routes
+
+logger = logging.getLogger(__name__)
+
+# Backends tried, in order, when no specific backend is requested
+LITE_BACKENDS = ("onnx", "numpy")
+
+
+def load_lite_engine(backend: str = "auto"):
+    """
+    Load a torch-free SimpleCNN engine.
+
+    Args:
+        backend: "onnx", "numpy", or "auto" to use the first backend that loads
+
+    Raises:
+        ValueError: If the backend is unknown
+        Exception: If no backend could be loaded
+    """
+    candidates = LITE_BACKENDS if backend == "auto" else (backend,)
+    last_error = None
+
+    for candidate in candidates:
+        try:
+            if candidate == "onnx":
+                from app.onnx_model import OnnxSimpleCNN
+                return OnnxSimpleCNN()
+            if candidate == "numpy":
+                from app.numpy_model import NumpySimpleCNN
+                return NumpySimpleCNN()
+            raise ValueError(f"Unknown prediction backend: {candidate}")
+        except Exception as e:
+            logger.warning(f"Backend {candidate} not available: {e}")
+            last_error = e
+
+    raise last_error
+
+
+def sigmoid(logits: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+def create_lite_predict_route(backend: str = "auto") -> Tuple[APIRouter, str]:
+    """
+    Build prediction routes backed by a torch-free engine.
+
+    Returns:
+        The router and the name of the backend that was loaded
+    """
+    engine = load_lite_engine(backend)
+
+    def predict_probabilities(input_batch: np.ndarray) -> List[float]:
+        return sigmoid(engine(input_batch)).tolist()
+
+    return create_prediction_routes(predict_probabilities, engine.name, engine.version), engine.name
@@ -1,15 +1,134 @@
 import torch
-from app.model import SimpleCNN  # your model definition
+import torchvision.transforms as transforms
+from app.model import SimpleCNN, fuse_conv_bn, to_fully_convolutional  # your model definition
+from app.compile_model import (
+    MODEL_COMPILE_MODE,
+    MODEL_WARMUP_BATCHES,
+    SAVE_COMPILED_MODEL,
+    compile_model,
+    compiled_model_path,
+    load_compiled_model,
+    save_compiled_model,
+    warmup_model,
+)
+from app.quantization import MODEL_QUANTIZATION, quantize_model
+from app.prediction_cache import file_version
 import os
+import asyncio
+import threading
+import time
 import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Optional, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_cnn_model():
+MODEL_PATH = "models/best_model.pth"
+MODEL_INPUT_SIZE = (64, 64)
+
+# "auto" uses models/best_model.safetensors when present, "pickle" always uses torch.load
+MODEL_WEIGHTS_FORMAT = os.environ.get("MODEL_WEIGHTS_FORMAT", "auto").lower()
+
+# Seconds before a failed model load is retried; doubles after every consecutive failure
+MODEL_LOAD_RETRY_SECONDS = float(os.environ.get("MODEL_LOAD_RETRY_SECONDS", "5"))
+MODEL_LOAD_RETRY_MAX_SECONDS = float(os.environ.get("MODEL_LOAD_RETRY_MAX_SECONDS", "300"))
+
+# Timings of the most recent model load, for comparing cold-start cost across formats
+MODEL_LOAD_METRICS = {}
+
+def safetensors_path(model_path: str) -> str:
+    return f"{os.path.splitext(model_path)[0]}.safetensors"
+
+def weights_version() -> Optional[str]:
+    """Version of the weights file ``load_cnn_model`` reads and of the settings that change its outputs."""
+    mapped_path = safetensors_path(MODEL_PATH)
+    if MODEL_WEIGHTS_FORMAT in ("auto", "safetensors") and os.path.exists(mapped_path):
+        return file_version(mapped_path, MODEL_QUANTIZATION)
+    return file_version(MODEL_PATH, MODEL_QUANTIZATION)
+
+def load_weights(model: torch.nn.Module, model_path: str, weights_format: str = MODEL_WEIGHTS_FORMAT) -> dict:
+    """
+    Load checkpoint weights into a model.
+    
+    A .safetensors file next to the checkpoint is memory-mapped: tensors are
+    backed by the file's pages and read lazily instead of being unpickled
+    and copied. Falls back to torch.load for the pickle checkpoint.
+    
+    Returns:
+        Load metrics (format, path, size, seconds)
+    """
+    start = time.perf_counter()
+    mapped_path = safetensors_path(model_path)
+    
+    if weights_format in ("auto", "safetensors") and os.path.exists(mapped_path):
+        try:
+            from safetensors.torch import load_file
+            
+            state_dict = load_file(mapped_path)
+            try:
+                # Adopt the memory-mapped tensors instead of copying into new parameters
+                model.load_state_dict(state_dict, assign=True)
+            except TypeError:
+                # torch < 2.1 has no assign option
+                model.load_state_dict(state_dict)
+            return {
+                "format": "safetensors",
+                "path": mapped_path,
+                "size_mb": os.path.getsize(mapped_path) / (1024 * 1024),
+                "load_seconds": time.perf_counter() - start
+            }
+        except ImportError:
+            logger.warning("safetensors not installed, loading pickle checkpoint")
+        except Exception as e:
+            logger.warning(f"Could not load {mapped_path}: {e}, loading pickle checkpoint")
+    
+    model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
+    return {
+        "format": "pickle",
+        "path": model_path,
+        "size_mb": os.path.getsize(model_path) / (1024 * 1024),
+        "load_seconds": time.perf_counter() - start
+    }
+
+# Fold BatchNorm into the convolutions at load time (set to false for debugging)
+MODEL_FUSE_CONV_BN = os.environ.get("MODEL_FUSE_CONV_BN", "true").lower() == "true"
+# Maximum allowed logit difference between the fused and original model
+MODEL_FUSION_TOLERANCE = float(os.environ.get("MODEL_FUSION_TOLERANCE", "1e-4"))
+
+def fuse_and_verify(model: SimpleCNN, tolerance: float = MODEL_FUSION_TOLERANCE) -> SimpleCNN:
+    """
+    Fuse Conv2d+BatchNorm2d pairs and check the fused model is numerically
+    equivalent. Falls back to the original model if the check fails.
+    """
+    fused = fuse_conv_bn(model)
+    check_input = torch.rand(4, 3, *MODEL_INPUT_SIZE)
+    with torch.no_grad():
+        max_diff = (fused(check_input) - model(check_input)).abs().max().item()
+    
+    if max_diff > tolerance:
+        logger.error(f"Conv-BN fusion changed outputs by {max_diff:.2e} (tolerance {tolerance:.0e}), using unfused model")
+        return model
+    
+    logger.info(f"Conv-BN fusion verified: max logit difference {max_diff:.2e}")
+    return fused
+
+def model_transform():
+    """Transform from an RGB PIL image to a SimpleCNN input tensor."""
+    return transforms.Compose([
+        transforms.Resize(MODEL_INPUT_SIZE),
+        transforms.ToTensor(),
+    ])
+
+def load_cnn_model(
+    compile_mode: str = MODEL_COMPILE_MODE,
+    warmup_batches: int = MODEL_WARMUP_BATCHES,
+    quantization: str = MODEL_QUANTIZATION,
+    fuse: bool = MODEL_FUSE_CONV_BN
+):
     try:
-        model_path = "models/best_model.pth"
+        model_path = MODEL_PATH
         logger.info(f"Attempting to load model from: {model_path}")
         
         # Check if model file exists
@@ -19,10 +138,182 @@ def load_cnn_model():
             logger.info(f"Directory contents: {os.listdir(os.path.dirname(model_path) if os.path.dirname(model_path) else '.')}")
             raise FileNotFoundError(f"Model file not found at: {model_path}")
         
-        model = SimpleCNN()
-        model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu')))
-        logger.info("Model loaded successfully")
+        load_start = time.perf_counter()
+        example_input = torch.zeros(1, 3, *MODEL_INPUT_SIZE)
+        model = None
+        load_metrics = {}
+        
+        # Reuse a previously compiled artifact when available
+        if compile_mode != "none":
+            variant_parts = (["fused"] if fuse else []) + ([quantization] if quantization != "none" else [])
+            artifact_path = compiled_model_path(model_path, compile_mode, ".".join(variant_parts))
+            model = load_compiled_model(artifact_path, model_path)
+            if model is not None:
+                load_metrics = {
+                    "format": "torchscript",
+                    "path": artifact_path,
+                    "size_mb": os.path.getsize(artifact_path) / (1024 * 1024),
+                    "load_seconds": time.perf_counter() - load_start
+                }
+        
+        if model is None:
+            model = SimpleCNN()
+            load_metrics = load_weights(model, model_path)
+            model.eval()
+            
+            if fuse:
+                model = fuse_and_verify(model)
+            
+            if quantization != "none":
+                model = quantize_model(model, quantization, example_input, model_transform())
+            
+            if compile_mode != "none":
+                logger.info(f"Compiling model with mode: {compile_mode}")
+                model = compile_model(model, compile_mode, example_input)
+                if SAVE_COMPILED_MODEL:
+                    save_compiled_model(model, artifact_path)
+        
+        warmup_seconds = warmup_model(model, example_input, warmup_batches)
+        
+        MODEL_LOAD_METRICS.clear()
+        MODEL_LOAD_METRICS.update(load_metrics)
+        MODEL_LOAD_METRICS.update({
+            "warmup_seconds": warmup_seconds,
+            "total_seconds": time.perf_counter() - load_start
+        })
+        logger.info(f"Model loaded successfully: {MODEL_LOAD_METRICS}")
         return model
     except Exception as e:
         logger.error(f"Error loading model: {str(e)}")
         raise
+
+def load_dense_model(fuse: bool = MODEL_FUSE_CONV_BN):
+    """
+    Load the float model in fully-convolutional form for dense region scoring.
+    
+    Built from the checkpoint rather than the serving model, which may be
+    quantized or compiled and so cannot be converted.
+    """
+    model = SimpleCNN()
+    load_weights(model, MODEL_PATH)
+    model.eval()
+    if fuse:
+        model = fuse_and_verify(model)
+    logger.info("Fully-convolutional model built for dense region scoring")
+    return to_fully_convolutional(model)
+
+
+class LazyModel:
+    """
+    Loads a model on first use, exactly once, from any thread.
+    
+    ``start()`` begins loading (and warming up) on a background thread so
+    importing the prediction routes never blocks; ``get()`` waits for that
+    load to finish, or performs it inline if nothing has started it yet,
+    and ``wait()`` awaits it from the event loop without occupying a thread.
+    A failed load is retried by the next caller once MODEL_LOAD_RETRY_SECONDS
+    have passed, doubling after every consecutive failure.
+    """
+    
+    def __init__(self, loader: Callable = load_cnn_model):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._attempt: Optional[Future] = None
+        self._model = None
+        self._error = None
+        self.state = "not_loaded"
+        self.started_at = None
+        self.ready_at = None
+        self.failures = 0
+        self.retry_at = None
+    
+    def _begin(self) -> Tuple[Future, bool]:
+        """Current load attempt, and whether the caller must run a new one."""
+        with self._lock:
+            retry_due = self.state == "failed" and time.time() >= self.retry_at
+            if self.state == "not_loaded" or retry_due:
+                self.state = "loading"
+                self.started_at = time.time()
+                self._attempt = Future()
+                # Running futures cannot be cancelled by a waiter that gives up
+                self._attempt.set_running_or_notify_cancel()
+                return self._attempt, True
+            return self._attempt, False
+    
+    def start(self) -> Future:
+        """Begin loading on a background thread (no-op if loading has already started) and return the attempt."""
+        attempt, begun = self._begin()
+        if begun:
+            threading.Thread(target=self._load, args=(attempt,), name="model-loader", daemon=True).start()
+        return attempt
+    
+    def _load(self, attempt: Future):
+        try:
+            model = self._loader()
+        except Exception as e:
+            with self._lock:
+                self._error = e
+                self.failures += 1
+                retry_delay = min(MODEL_LOAD_RETRY_SECONDS * 2 ** (self.failures - 1), MODEL_LOAD_RETRY_MAX_SECONDS)
+                self.retry_at = time.time() + retry_delay
+                self.state = "failed"
+            logger.error(f"Failed to load model: {str(e)}, retrying after {retry_delay:.0f}s")
+            attempt.set_exception(e)
+            return
+        with self._lock:
+            self._model = model
+            self._error = None
+            self.state = "ready"
+            self.ready_at = time.time()
+        attempt.set_result(model)
+    
+    def get(self, timeout: Optional[float] = None):
+        """
+        Return the loaded model, waiting for an in-progress load.
+        
+        Raises:
+            RuntimeError: If loading failed or did not finish within ``timeout``
+        """
+        if self._model is not None:
+            return self._model
+        attempt, begun = self._begin()
+        if begun:
+            # First use without a background load, or a retry: load on this thread
+            self._load(attempt)
+        try:
+            return attempt.result(timeout)
+        except FutureTimeoutError:
+            raise RuntimeError("Model is still loading")
+        except Exception as e:
+            raise RuntimeError(f"Model failed to load: {e}")
+    
+    async def wait(self):
+        """
+        Await the loaded model from the event loop, loading it on a background thread if needed.
+        
+        Raises:
+            RuntimeError: If loading failed
+        """
+        if self._model is not None:
+            return self._model
+        try:
+            return await asyncio.wrap_future(self.start())
+        except Exception as e:
+            raise RuntimeError(f"Model failed to load: {e}")
+    
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+    
+    def status(self) -> dict:
+        """Readiness and load timing, reported separately for health checks."""
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "error": str(self._error) if self._error is not None else None,
+            "failures": self.failures,
+            "retry_in_seconds": max(0.0, self.retry_at - time.time()) if self.state == "failed" else None,
+            # Time from the start of loading until ready (or until now while loading)
+            "elapsed_seconds": (self.ready_at or time.time()) - self.started_at if self.started_at else None,
+            "load": dict(MODEL_LOAD_METRICS) if self.ready else {}
+        }
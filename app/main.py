@@ -34,24 +34,43 @@ try:
             logger.warning(f"ECS prediction not available: {ecs_error}")
             use_ecs_pytorch = False
     
-    if not use_ecs_pytorch:
+    # A torch-free backend can be requested explicitly (e.g. PREDICTION_BACKEND=onnx)
+    prediction_backend = os.getenv('PREDICTION_BACKEND', 'auto').lower()
+    
+    if not use_ecs_pytorch and prediction_backend != 'auto':
+        try:
+            from app.lite_predict import create_lite_predict_route
+            lite_predict_route, prediction_method = create_lite_predict_route(prediction_backend)
+            logger.info(f"Using torch-free prediction backend: {prediction_method}")
+        except (ImportError, Exception) as lite_error:
+            logger.warning(f"Prediction backend {prediction_backend} not available: {lite_error}")
+            prediction_backend = 'auto'
+    
+    if not use_ecs_pytorch and prediction_backend == 'auto':
         # Try to import PyTorch dependencies for local processing
         try:
             import torch
             import torchvision
-            from app.predict import predict_route
+            from app.predict import predict_route, model_holder
             prediction_method = "local_pytorch"
             logger.info("Using local PyTorch prediction model")
         except (ImportError, OSError, Exception) as torch_error:
             logger.warning(f"PyTorch not available: {torch_error}")
-            # Fall back to simple prediction without PyTorch
+            # Prefer a torch-free backend with real predictions
             try:
-                from app.simple_predict import simple_predict_route
-                prediction_method = "simple"
-                logger.info("Using simplified prediction model (no PyTorch)")
-            except (ImportError, Exception) as simple_error:
-                logger.error(f"Failed to import simple prediction: {simple_error}")
-                raise
+                from app.lite_predict import create_lite_predict_route
+                lite_predict_route, prediction_method = create_lite_predict_route()
+                logger.info(f"Using torch-free prediction backend: {prediction_method}")
+            except (ImportError, Exception) as lite_error:
+                logger.warning(f"Torch-free prediction backends not available: {lite_error}")
+                # Fall back to simple prediction without PyTorch
+                try:
+                    from app.simple_predict import simple_predict_route
+                    prediction_method = "simple"
+                    logger.info("Using simplified prediction model (no PyTorch)")
+                except (ImportError, Exception) as simple_error:
+                    logger.error(f"Failed to import simple prediction: {simple_error}")
+                    raise
     
     # Initialize FastAPI app
     app = FastAPI(
@@ -67,10 +86,20 @@ try:
         async def predict_endpoint(file: UploadFile = File(...)):
             return await ecs_predict_route(file)
     elif prediction_method == "local_pytorch":
-        app.include_router(predict_route)
+        app.include_router(predict_route, prefix="/predict")
+    elif prediction_method != "simple":  # torch-free backend
+        app.include_router(lite_predict_route, prefix="/predict")
     else:  # simple prediction
         app.include_router(simple_predict_route, prefix="/predict")
     
+    if prediction_method not in ("ecs_pytorch", "simple"):
+        from app.decode_pool import decode_pool
+        
+        # Stop decode worker processes with the server so none outlive it
+        @app.on_event("shutdown")
+        async def shutdown_decode_pool():
+            decode_pool.shutdown()
+    
     # Include debug router for troubleshooting
     try:
         from app.debug_endpoint import debug_router
@@ -100,9 +129,13 @@ try:
         torch_version = torch.__version__ if 'torch' in sys.modules else "Not available"
         torchvision_version = torchvision.__version__ if 'torchvision' in sys.modules else "Not available"
         
+        # Readiness and load timing of the local model, reported separately from liveness
+        model_status = model_holder.status() if prediction_method == "local_pytorch" else None
+        
         return {
             "status": "healthy",
             "prediction_method": prediction_method,
+            "model": model_status,
             "environment": {
                 "python_version": sys.version,
                 "working_directory": os.getcwd(),
@@ -1,3 +1,4 @@
+import copy
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -37,3 +38,79 @@ class SimpleCNN(nn.Module):
 
 
 
+
+
+def fuse_conv_bn(model: SimpleCNN) -> SimpleCNN:
+    """
+    Return an inference copy of the model with each BatchNorm2d folded into
+    the Conv2d before it.
+
+    The BatchNorm layers are removed from ``features``, so each block runs
+    Conv → ReLU → MaxPool. Only valid in eval mode (uses running statistics).
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+    fused = copy.deepcopy(model).eval()
+    layers = []
+    for layer in fused.features:
+        if isinstance(layer, nn.BatchNorm2d) and layers and isinstance(layers[-1], nn.Conv2d):
+            layers[-1] = fuse_conv_bn_eval(layers[-1], layer)
+        else:
+            layers.append(layer)
+    fused.features = nn.Sequential(*layers)
+    return fused
+
+
+class FullyConvolutionalSimpleCNN(nn.Module):
+    """
+    SimpleCNN with the Flatten + Linear classifier expressed as convolutions.
+
+    ``classifier.1`` (Linear 128*8*8 → 256) becomes an 8x8 convolution over
+    the feature map and ``classifier.4`` (Linear 256 → 1) a 1x1 convolution.
+    On a 64x64 input the logit is identical to SimpleCNN; on a larger input
+    one forward pass returns the logit of every 64x64 window, at a stride of
+    ``stride * 8`` pixels, sharing the convolution features between windows.
+    """
+
+    # Input window seen by one output and pixels per feature map cell
+    window = 64
+    cell = 8
+
+    def __init__(self, features: nn.Sequential, fc1: nn.Conv2d, fc2: nn.Conv2d):
+        super(FullyConvolutionalSimpleCNN, self).__init__()
+        self.features = features
+        self.fc1 = fc1
+        self.fc2 = fc2
+
+    def classify(self, features: torch.Tensor, stride: int = 1) -> torch.Tensor:
+        """Logit map [N, rows, cols] for windows every ``stride`` feature cells."""
+        x = F.relu(F.conv2d(features, self.fc1.weight, self.fc1.bias, stride=stride))
+        # Dropout is the identity at inference time
+        return self.fc2(x)[:, 0]
+
+    def forward(self, x, stride: int = 1):
+        return self.classify(self.features(x), stride)
+
+
+def to_fully_convolutional(model: SimpleCNN) -> FullyConvolutionalSimpleCNN:
+    """
+    Convert a SimpleCNN (fused or not) into its fully-convolutional form.
+
+    The Linear weights are reshaped, not retrained: PyTorch flattens the
+    [128, 8, 8] feature map in channel-major order, which is exactly the
+    layout of an [out, 128, 8, 8] convolution kernel.
+    """
+    fc1 = model.classifier[1]
+    fc2 = model.classifier[4]
+    channels = [layer for layer in model.features if isinstance(layer, nn.Conv2d)][-1].out_channels
+    kernel = int(round((fc1.in_features / channels) ** 0.5))
+
+    conv1 = nn.Conv2d(channels, fc1.out_features, kernel_size=kernel)
+    conv1.weight.data = fc1.weight.data.reshape(fc1.out_features, channels, kernel, kernel).clone()
+    conv1.bias.data = fc1.bias.data.clone()
+
+    conv2 = nn.Conv2d(fc2.in_features, fc2.out_features, kernel_size=1)
+    conv2.weight.data = fc2.weight.data.reshape(fc2.out_features, fc2.in_features, 1, 1).clone()
+    conv2.bias.data = fc2.bias.data.clone()
+
+    return FullyConvolutionalSimpleCNN(copy.deepcopy(model.features), conv1, conv2).eval()
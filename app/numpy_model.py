@@ -0,0 +1,127 @@
+"""
+Pure-NumPy SimpleCNN inference
+Runs the SimpleCNN forward pass with no native ML runtime
+"""
+
+import os
+import logging
+
+import numpy as np
+
+from app.prediction_cache import file_version
+
+logger = logging.getLogger(__name__)
+
+NUMPY_MODEL_PATH = os.environ.get("NUMPY_MODEL_PATH", "models/best_model.npz")
+
+# BatchNorm2d default epsilon
+BATCHNORM_EPS = 1e-5
+
+# (conv, batchnorm) module indices inside SimpleCNN.features
+CONV_BN_LAYERS = ((0, 1), (4, 5), (8, 9))
+
+
+def fold_batchnorm(weight, bias, gamma, beta, running_mean, running_var, eps=BATCHNORM_EPS):
+    """Fold eval-mode BatchNorm statistics into the preceding convolution's weight and bias."""
+    scale = gamma / np.sqrt(running_var + eps)
+    folded_weight = weight * scale[:, None, None, None]
+    folded_bias = (bias - running_mean) * scale + beta
+    return folded_weight.astype(np.float32), folded_bias.astype(np.float32)
+
+
+def conv3x3(x: np.ndarray, weight_matrix: np.ndarray, bias: np.ndarray) -> np.ndarray:
+    """
+    3x3 convolution with padding 1 as a single im2col matrix multiply.
+
+    Args:
+        x: Input of shape [N, H, W, C] (channels last)
+        weight_matrix: Weights of shape [C * 9, O], rows ordered (C, kh, kw)
+        bias: Bias of shape [O]
+
+    Returns:
+        Output of shape [N, H, W, O]
+    """
+    n, h, w, c = x.shape
+    padded = np.pad(x, ((0, 0), (1, 1), (1, 1), (0, 0)))
+    # [N, H, W, C, 3, 3] view of every 3x3 neighbourhood, no copy yet
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (3, 3), axis=(1, 2))
+    columns = windows.reshape(n * h * w, c * 9)
+    out = columns @ weight_matrix
+    out += bias
+    return out.reshape(n, h, w, -1)
+
+
+def max_pool2x2(x: np.ndarray) -> np.ndarray:
+    """2x2 max pooling with stride 2 on a channels-last tensor."""
+    n, h, w, c = x.shape
+    return x.reshape(n, h // 2, 2, w // 2, 2, c).max(axis=(2, 4))
+
+
+class NumpySimpleCNN:
+    """
+    SimpleCNN forward pass in NumPy, using weights exported with
+    ``python export_model.py --format npz``.
+
+    BatchNorm is folded into the convolutions at load time and activations
+    are kept channels-last so every convolution is one BLAS matrix multiply.
+    """
+
+    name = "numpy"
+
+    def __init__(self, model_path: str = NUMPY_MODEL_PATH):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"NumPy model not found at: {model_path}")
+
+        with np.load(model_path) as state:
+            self._load_state(state)
+        self.version = file_version(model_path)
+        logger.info(f"NumPy model loaded from {model_path}")
+
+    def _load_state(self, state):
+        self.conv_layers = []
+        for conv_index, bn_index in CONV_BN_LAYERS:
+            weight, bias = fold_batchnorm(
+                state[f"features.{conv_index}.weight"],
+                state[f"features.{conv_index}.bias"],
+                state[f"features.{bn_index}.weight"],
+                state[f"features.{bn_index}.bias"],
+                state[f"features.{bn_index}.running_mean"],
+                state[f"features.{bn_index}.running_var"],
+            )
+            out_channels = weight.shape[0]
+            weight_matrix = np.ascontiguousarray(weight.reshape(out_channels, -1).T)
+            self.conv_layers.append((weight_matrix, bias))
+
+        # classifier.1 expects the CHW flatten order of PyTorch; reorder its
+        # columns once so channels-last features can be flattened directly
+        fc1_weight = state["classifier.1.weight"]
+        channels = self.conv_layers[-1][0].shape[1]
+        spatial = int(round((fc1_weight.shape[1] / channels) ** 0.5))
+        fc1_weight = fc1_weight.reshape(-1, channels, spatial, spatial).transpose(0, 2, 3, 1)
+        self.fc1_weight = np.ascontiguousarray(fc1_weight.reshape(fc1_weight.shape[0], -1).T, dtype=np.float32)
+        self.fc1_bias = state["classifier.1.bias"].astype(np.float32)
+        self.fc2_weight = np.ascontiguousarray(state["classifier.4.weight"].T, dtype=np.float32)
+        self.fc2_bias = state["classifier.4.bias"].astype(np.float32)
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Run the model on a float32 batch of shape [N, 3, 64, 64].
+
+        Returns:
+            Raw logits of shape [N]
+        """
+        x = np.ascontiguousarray(np.asarray(batch, dtype=np.float32).transpose(0, 2, 3, 1))
+
+        for weight_matrix, bias in self.conv_layers:
+            x = conv3x3(x, weight_matrix, bias)
+            np.maximum(x, 0, out=x)
+            x = max_pool2x2(x)
+
+        x = x.reshape(x.shape[0], -1)
+        x = x @ self.fc1_weight
+        x += self.fc1_bias
+        np.maximum(x, 0, out=x)
+        # Dropout is the identity at inference time
+        x = x @ self.fc2_weight
+        x += self.fc2_bias
+        return x.reshape(-1)
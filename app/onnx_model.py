@@ -0,0 +1,47 @@
+"""
+ONNX Runtime inference for SimpleCNN without PyTorch
+"""
+
+import os
+import logging
+
+import numpy as np
+
+from app.prediction_cache import file_version
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "models/best_model.onnx")
+# 0 lets onnxruntime choose based on the available cores
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0"))
+
+
+class OnnxSimpleCNN:
+    """SimpleCNN exported with export_model.py, served by onnxruntime."""
+
+    name = "onnx"
+
+    def __init__(self, model_path: str = ONNX_MODEL_PATH):
+        import onnxruntime as ort
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found at: {model_path}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_INTRA_OP_THREADS > 0:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.version = file_version(model_path)
+        logger.info(f"ONNX model loaded from {model_path} (onnxruntime {ort.__version__})")
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Run the model on a float32 batch of shape [N, 3, 64, 64].
+
+        Returns:
+            Raw logits of shape [N]
+        """
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0].reshape(-1)
@@ -0,0 +1,139 @@
+"""
+In-process prediction cache
+Remembers results for identical uploads so warm containers can answer resubmissions instantly
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Maximum cached predictions (0 disables the cache)
+PREDICTION_CACHE_ENTRIES = int(os.environ.get("PREDICTION_CACHE_ENTRIES", "1024"))
+# Maximum total size of cached results, measured as serialized JSON
+PREDICTION_CACHE_MAX_BYTES = int(os.environ.get("PREDICTION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Seconds a cached prediction stays valid
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", "3600"))
+
+
+def content_hash(contents: bytes) -> str:
+    """SHA-256 of the uploaded bytes."""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def file_version(path: str, *settings) -> Optional[str]:
+    """
+    Version of a model file, from its size and modification time, plus any
+    settings that change its outputs; None if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return "-".join([str(stat.st_size), str(stat.st_mtime_ns), *[str(setting) for setting in settings]])
+
+
+def cache_key(digest: str, model: Any, *options) -> str:
+    """Key for one prediction: content, the model that scores it and any options that change the result."""
+    return ":".join([digest, str(model), *[str(option) for option in options]])
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of prediction results with a TTL, bounded by entry
+    count and by the total size of the cached results.
+    """
+
+    def __init__(self, max_entries: int = PREDICTION_CACHE_ENTRIES,
+                 max_bytes: int = PREDICTION_CACHE_MAX_BYTES, ttl: float = PREDICTION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a cached result, or None on a miss or an expired entry."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: dict):
+        """Store a result, evicting least recently used entries to stay within bounds."""
+        if not self.enabled:
+            return
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+def cacheable(response: dict) -> bool:
+    """Results affected by a transient failure are not cached, so a resubmission retries them."""
+    s3_key = response.get("image_details", {}).get("s3_key")
+    return s3_key != "upload_failed" and "escalation_error" not in response.get("cascade", {})
+
+
+def cached_response(cached: dict, filename: str) -> dict:
+    """Copy of a cached response for a new upload of the same bytes."""
+    response = dict(cached)
+    response["image_details"] = {**cached["image_details"], "filename": filename}
+    response["cached"] = True
+    return response
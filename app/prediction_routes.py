@@ -0,0 +1,521 @@
+"""
+Shared prediction routes
+Builds the /predict handlers around a backend's forward function, so every backend serves the same API
+"""
+
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from typing import Awaitable, Callable, List, Optional, Sequence
+import asyncio
+import os
+import time
+import logging
+import traceback
+
+import numpy as np
+
+from app.image_utils import ImageTooLargeError, decode_stats
+from app.preprocessing import get_preprocessor
+from app.tissue_filter import non_tissue_result, prepare_pixels, tissue_filter_stats
+from app.decode_pool import decode_pool
+from app.cascade import CASCADE_ENABLED, cascade_decision, cascade_stats
+from app.prediction_cache import PREDICTION_CACHE_ENTRIES, PredictionCache, cache_key, cacheable, cached_response, content_hash
+from app.single_flight import SingleFlight
+from app.executor import prediction_executor
+from app.tta import predict_with_tta
+from app.tiling import TILE_ADAPTIVE, TILE_DENSE, TILE_PATCH_SIZE, predict_region
+from app.s3_utils import S3Handler
+
+logger = logging.getLogger(__name__)
+
+# Get S3 bucket name from environment variable or use a default for development
+S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME", "breast-cancer-detection-api-dev-images")
+
+# Maximum number of files accepted by the batch endpoint
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "64"))
+
+# SimpleCNN input size (width, height)
+MODEL_INPUT_SIZE = (64, 64)
+
+# SimpleCNN inputs are scaled to [0, 1] without normalization
+preprocessor = get_preprocessor()
+
+
+def get_s3_handler():
+    """Dependency to get S3 handler instance."""
+    try:
+        return S3Handler(S3_BUCKET_NAME)
+    except Exception as e:
+        logger.error(f"Failed to initialize S3 handler: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"S3 initialization error: {str(e)}")
+
+
+def upload_to_s3(s3_handler: S3Handler, contents: bytes, filename: str) -> dict:
+    """Store the original image in S3, returning placeholder details if the upload fails."""
+    try:
+        s3_result = s3_handler.upload_image(contents, filename)
+        logger.info(f"Image uploaded to S3: {s3_result['s3_key']}")
+        return s3_result
+    except Exception as s3_error:
+        logger.error(f"S3 upload error: {str(s3_error)}")
+        logger.error(traceback.format_exc())
+        # Continue with prediction even if S3 upload fails
+        return {"s3_url": "upload_failed", "s3_key": "upload_failed", "bucket": S3_BUCKET_NAME}
+
+
+async def prepare_uploads(contents_list: Sequence[bytes], filenames: Sequence[str], digests: Sequence[str],
+                          target_size: tuple, single_flight: SingleFlight) -> list:
+    """
+    Run ``prepare_pixels`` on a batch of uploads, once per distinct image.
+
+    Large batches are decoded across the decode pool's processes. Smaller ones
+    are decoded on the prediction executor, where ``single_flight`` also
+    shares the decode of an identical upload in flight in another request.
+
+    Returns:
+        For every upload, in order, the result of ``prepare_pixels`` or the
+        exception it raised
+    """
+    distinct = {}  # digest -> index of its first upload
+    for index, digest in enumerate(digests):
+        distinct.setdefault(digest, index)
+    if decode_pool.use_for(len(distinct)):
+        pooled = await prediction_executor.run(
+            decode_pool.prepare_batch,
+            [contents_list[index] for index in distinct.values()],
+            [filenames[index] for index in distinct.values()],
+            target_size
+        )
+        by_digest = dict(zip(distinct, pooled))
+        return [by_digest[digest] for digest in digests]
+
+    return await asyncio.gather(
+        *[
+            single_flight.do(
+                ("decode", digest),
+                lambda contents=contents, filename=filename: prediction_executor.run(
+                    prepare_pixels, contents, filename, target_size
+                )
+            )
+            for contents, filename, digest in zip(contents_list, filenames, digests)
+        ],
+        return_exceptions=True
+    )
+
+
+def create_prediction_routes(
+    predict_probabilities: Callable[[np.ndarray], List[float]],
+    name: str,
+    version: Optional[str],
+    ensure_ready: Optional[Callable[[], Awaitable[None]]] = None,
+    get_dense_scorer: Optional[Callable[[], Awaitable]] = None,
+    model_status: Optional[Callable[[], dict]] = None
+) -> APIRouter:
+    """
+    Build the /, /batch, /region and /stats prediction routes.
+
+    Args:
+        predict_probabilities: Scores a float32 batch of shape [N, 3, 64, 64],
+            returning one malignant probability per image
+        name: Backend name, reported in responses and part of every cache key
+        version: Version of the weights the backend serves, part of every
+            cache key; None disables the cache
+        ensure_ready: Awaited before scoring, e.g. to wait for a model that
+            is still loading; raises HTTPException if the model is unavailable
+        get_dense_scorer: Returns the fully-convolutional region scorer; regions
+            cannot be scored with ``dense=true`` without it
+        model_status: Model loading state reported by /stats
+    """
+    router = APIRouter()
+    # Results of recent uploads, keyed by the version of the weights that scored them
+    prediction_cache = PredictionCache(max_entries=PREDICTION_CACHE_ENTRIES if version is not None else 0)
+    # Identical uploads in flight at the same time share one decode and inference
+    single_flight = SingleFlight()
+
+    async def wait_until_ready():
+        if ensure_ready is not None:
+            await ensure_ready()
+
+    def predict_probabilities_tta(input_batch: np.ndarray):
+        """Score the 8 flip/rotation views of every image in one forward pass."""
+        return predict_with_tta(predict_probabilities, input_batch)
+
+    def predict_pixels(pixels_list: List[np.ndarray]) -> List[float]:
+        """Preprocess decoded images straight into one input batch and score it."""
+        return predict_probabilities(preprocessor.batch(pixels_list))
+
+    def predict_pixels_tta(pixels_list: List[np.ndarray]):
+        """Preprocess decoded images into one batch and score it with TTA."""
+        return predict_probabilities_tta(preprocessor.batch(pixels_list))
+
+    async def score_upload(contents: bytes, filename: str, content_type: Optional[str], tta: bool, cascade: bool) -> dict:
+        """
+        Decode and score one upload, escalating it through the cascade if requested.
+
+        Runs once for all concurrent requests with the same bytes and options.
+
+        Raises:
+            HTTPException: If the image is invalid or the prediction fails
+        """
+        try:
+            async with prediction_executor.limit():
+                stage1_start = time.perf_counter()
+                pixels, tissue = await prediction_executor.run(prepare_pixels, contents, filename, MODEL_INPUT_SIZE)
+                logger.info("Image decoded for model input")
+
+                # Make prediction, averaging over flip/rotation views if requested
+                tta_details = None
+                if pixels is None:
+                    # Background or blank image: answered without running the model
+                    prob = 0.0
+                elif tta:
+                    summaries, tta_timing = await prediction_executor.run(predict_pixels_tta, [pixels])
+                    tta_details = {**summaries[0], **tta_timing}
+                    prob = summaries[0]["mean"]
+                else:
+                    prob = (await prediction_executor.run(predict_pixels, [pixels]))[0]
+                stage1_seconds = time.perf_counter() - stage1_start
+                predicted_class = 1 if prob > 0.5 else 0
+                logger.info(f"Prediction complete ({name}): class={predicted_class}, probability={prob}")
+        except ImageTooLargeError as size_error:
+            logger.error(f"Image rejected: {str(size_error)}")
+            raise HTTPException(status_code=413, detail=str(size_error))
+        except ValueError as img_error:
+            logger.error(f"Image processing error: {str(img_error)}")
+            raise HTTPException(status_code=400, detail=f"Invalid image: {str(img_error)}")
+        except Exception as pred_error:
+            logger.error(f"Prediction error: {str(pred_error)}")
+            logger.error(traceback.format_exc())
+            raise HTTPException(status_code=500, detail=f"Prediction error: {str(pred_error)}")
+
+        # Escalate uncertain results to the heavy model, outside the CPU-bound stage
+        cascade_details = None
+        if cascade and pixels is not None:
+            prob, cascade_details = await cascade_decision(
+                prob, stage1_seconds, contents, filename, content_type
+            )
+
+        return {
+            "probability": prob,
+            "tissue": tissue,
+            "has_tissue": pixels is not None,
+            "tta": tta_details,
+            "cascade": cascade_details
+        }
+
+    @router.post("/")
+    async def predict(
+        file: UploadFile = File(...),
+        tta: bool = False,
+        cascade: bool = CASCADE_ENABLED,
+        s3_handler: S3Handler = Depends(get_s3_handler)
+    ):
+        """
+        Score one image. With ``cascade=true``, SimpleCNN probabilities inside
+        the uncertainty band are escalated to the ECS BreastCancerCNN.
+        """
+        try:
+            # Read the uploaded file
+            contents = await file.read()
+            logger.info(f"Received file: {file.filename}, size: {len(contents)} bytes")
+
+            # Identical bytes with the same weights and options: skip decode, upload and inference,
+            # without waiting for a model that is still loading
+            key = cache_key(content_hash(contents), name, version, tta, cascade)
+            cached = prediction_cache.get(key)
+            if cached is not None:
+                logger.info(f"Prediction cache hit for {file.filename}")
+                return cached_response(cached, file.filename)
+
+            # Wait for the model if it is still loading
+            await wait_until_ready()
+
+            # Store the original image in S3 while the prediction runs
+            s3_task = asyncio.ensure_future(
+                prediction_executor.run_io(upload_to_s3, s3_handler, contents, file.filename)
+            )
+
+            # Decode and score, sharing the work with identical uploads already in flight
+            scored = await single_flight.do(
+                key, lambda: score_upload(contents, file.filename, file.content_type, tta, cascade)
+            )
+            prob = scored["probability"]
+            predicted_class = 1 if prob > 0.5 else 0
+            tissue = scored["tissue"]
+
+            s3_result = await s3_task
+
+            # Return prediction results along with S3 information
+            response = {
+                "message": "Prediction successful",
+                "prediction": predicted_class,
+                "probability": prob,
+                "backend": name,
+                "image_details": {
+                    "filename": file.filename,
+                    "s3_url": s3_result["s3_url"],
+                    "s3_key": s3_result["s3_key"],
+                    "bucket": s3_result["bucket"]
+                }
+            }
+            if tissue is not None:
+                response["tissue"] = tissue
+            if not scored["has_tissue"]:
+                response.update(non_tissue_result(tissue))
+                response["message"] = "No tissue detected"
+            if scored["tta"] is not None:
+                response["tta"] = scored["tta"]
+            if scored["cascade"] is not None:
+                response["cascade"] = scored["cascade"]
+            if cacheable(response):
+                prediction_cache.put(key, response)
+            return response
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in predict endpoint: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    @router.post("/batch")
+    async def predict_batch(
+        files: List[UploadFile] = File(...),
+        tta: bool = False,
+        cascade: bool = CASCADE_ENABLED,
+        s3_handler: S3Handler = Depends(get_s3_handler)
+    ):
+        """
+        Score many images with a single forward pass.
+
+        Results are returned in input order. Files that cannot be decoded are
+        reported individually and do not fail the rest of the batch. With
+        ``tta=true`` all 8 views of every image share that forward pass, and
+        with ``cascade=true`` uncertain images are escalated concurrently.
+        """
+        try:
+            # Wait for the model if it is still loading
+            await wait_until_ready()
+
+            if len(files) > MAX_BATCH_FILES:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Too many files: {len(files)} (maximum {MAX_BATCH_FILES})"
+                )
+
+            logger.info(f"Received batch of {len(files)} files")
+
+            contents_list = [await file.read() for file in files]
+
+            # Upload originals on the I/O pool while images are decoded and scored
+            s3_tasks = asyncio.gather(*[
+                prediction_executor.run_io(upload_to_s3, s3_handler, contents, file.filename)
+                for file, contents in zip(files, contents_list)
+            ])
+
+            results = [{"filename": file.filename} for file in files]
+            # One input per distinct image; duplicates share its position
+            digests = [content_hash(contents) for contents in contents_list]
+            inputs = []
+            input_indices = []
+            input_positions = {}
+            scored_indices = []  # (file index, input position)
+            non_tissue = 0
+
+            async with prediction_executor.limit():
+                stage1_start = time.perf_counter()
+                # Duplicate files, in this batch or in flight elsewhere, are decoded once
+                decoded = await prepare_uploads(
+                    contents_list, [file.filename for file in files], digests, MODEL_INPUT_SIZE, single_flight
+                )
+
+                for index, (file, item) in enumerate(zip(files, decoded)):
+                    if isinstance(item, ImageTooLargeError):
+                        logger.error(f"Image rejected for {file.filename}: {str(item)}")
+                        results[index].update({"status": "error", "error": str(item)})
+                    elif isinstance(item, ValueError):
+                        logger.error(f"Image processing error for {file.filename}: {str(item)}")
+                        results[index].update({"status": "error", "error": f"Invalid image: {str(item)}"})
+                    elif isinstance(item, Exception):
+                        logger.error(f"Unexpected processing error for {file.filename}: {str(item)}")
+                        results[index].update({"status": "error", "error": f"Processing error: {str(item)}"})
+                    else:
+                        pixels, tissue = item
+                        if tissue is not None:
+                            results[index]["tissue"] = tissue
+                        if pixels is None:
+                            results[index].update({"status": "success", **non_tissue_result(tissue)})
+                            non_tissue += 1
+                        else:
+                            if digests[index] not in input_positions:
+                                input_positions[digests[index]] = len(inputs)
+                                inputs.append(pixels)
+                                input_indices.append(index)
+                            scored_indices.append((index, input_positions[digests[index]]))
+
+                tta_summaries = None
+                tta_timing = None
+                if inputs:
+                    try:
+                        if tta:
+                            tta_summaries, tta_timing = await prediction_executor.run(predict_pixels_tta, inputs)
+                            probs = [summary["mean"] for summary in tta_summaries]
+                        else:
+                            probs = await prediction_executor.run(predict_pixels, inputs)
+                    except Exception as pred_error:
+                        logger.error(f"Batch prediction error: {str(pred_error)}")
+                        logger.error(traceback.format_exc())
+                        raise HTTPException(status_code=500, detail=f"Prediction error: {str(pred_error)}")
+                stage1_seconds = time.perf_counter() - stage1_start
+
+            cascade_details = None
+            if cascade and inputs:
+                decisions = await asyncio.gather(*[
+                    cascade_decision(prob, stage1_seconds, contents_list[index], files[index].filename, files[index].content_type)
+                    for index, prob in zip(input_indices, probs)
+                ])
+                probs = [prob for prob, _ in decisions]
+                cascade_details = [details for _, details in decisions]
+
+            for result, s3_result in zip(results, await s3_tasks):
+                result["image_details"] = {
+                    "s3_url": s3_result["s3_url"],
+                    "s3_key": s3_result["s3_key"],
+                    "bucket": s3_result["bucket"]
+                }
+
+            for index, position in scored_indices:
+                prob = probs[position]
+                results[index].update({
+                    "status": "success",
+                    "prediction": 1 if prob > 0.5 else 0,
+                    "probability": prob
+                })
+                if tta_summaries is not None:
+                    results[index]["tta"] = tta_summaries[position]
+                if cascade_details is not None:
+                    results[index]["cascade"] = cascade_details[position]
+
+            logger.info(
+                f"Batch prediction complete: {len(scored_indices)}/{len(files)} files scored "
+                f"({len(inputs)} distinct), {non_tissue} without tissue"
+            )
+
+            response = {
+                "message": "Batch prediction complete",
+                "backend": name,
+                "total": len(files),
+                "succeeded": len(scored_indices) + non_tissue,
+                "failed": len(files) - len(scored_indices) - non_tissue,
+                "non_tissue": non_tissue,
+                "results": results
+            }
+            if tta_timing is not None:
+                response["tta"] = tta_timing
+            return response
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in batch predict endpoint: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    @router.post("/region")
+    async def predict_slide_region(
+        file: UploadFile = File(...),
+        patch_size: int = TILE_PATCH_SIZE,
+        stride: Optional[int] = None,
+        heatmap: bool = True,
+        adaptive: bool = TILE_ADAPTIVE,
+        dense: bool = TILE_DENSE,
+        s3_handler: S3Handler = Depends(get_s3_handler)
+    ):
+        """
+        Score a large slide region patch by patch.
+
+        The region is cut into ``patch_size`` patches every ``stride`` pixels and
+        scored in fixed-size batches. Returns a probability heatmap (one value
+        per patch, row-major) and aggregate statistics. With ``dense=true`` all
+        patches are scored by the fully-convolutional model in one pass over the
+        region, which makes small strides far cheaper. With ``adaptive=true`` a
+        coarse grid is scored first and only uncertain areas are refined.
+        """
+        try:
+            await wait_until_ready()
+            dense_scorer = None
+            if dense:
+                if get_dense_scorer is None:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Dense scoring is not available with the {name} backend"
+                    )
+                dense_scorer = await get_dense_scorer()
+
+            contents = await file.read()
+            logger.info(f"Received region: {file.filename}, size: {len(contents)} bytes")
+
+            s3_task = asyncio.ensure_future(
+                prediction_executor.run_io(upload_to_s3, s3_handler, contents, file.filename)
+            )
+
+            try:
+                async with prediction_executor.limit():
+                    result = await prediction_executor.run(
+                        predict_region,
+                        predict_probabilities,
+                        contents,
+                        file.filename,
+                        patch_size,
+                        stride,
+                        include_heatmap=heatmap,
+                        dense_scorer=dense_scorer,
+                        adaptive=adaptive,
+                        load_fn=decode_pool.load_region
+                    )
+            except ImageTooLargeError as size_error:
+                logger.error(f"Image rejected: {str(size_error)}")
+                raise HTTPException(status_code=413, detail=str(size_error))
+            except ValueError as img_error:
+                logger.error(f"Region processing error: {str(img_error)}")
+                raise HTTPException(status_code=400, detail=f"Invalid region: {str(img_error)}")
+            except Exception as pred_error:
+                logger.error(f"Region prediction error: {str(pred_error)}")
+                logger.error(traceback.format_exc())
+                raise HTTPException(status_code=500, detail=f"Prediction error: {str(pred_error)}")
+
+            s3_result = await s3_task
+
+            return {
+                "message": "Region prediction successful",
+                "backend": name,
+                **result,
+                "image_details": {
+                    "filename": file.filename,
+                    "s3_url": s3_result["s3_url"],
+                    "s3_key": s3_result["s3_key"],
+                    "bucket": s3_result["bucket"]
+                }
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in region predict endpoint: {str(e)}")
+            logger.error(traceback.format_exc())
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    @router.get("/stats")
+    async def predict_stats():
+        """Runtime statistics for the prediction path."""
+        stats = {
+            "backend": name,
+            "executor": prediction_executor.stats(),
+            "decode": decode_stats.as_dict(),
+            "decode_pool": decode_pool.stats(),
+            "tissue_filter": tissue_filter_stats.as_dict(),
+            "cascade": cascade_stats.as_dict(),
+            "cache": prediction_cache.stats(),
+            "coalescing": single_flight.stats()
+        }
+        if model_status is not None:
+            stats["model"] = model_status()
+        return stats
+
+    return router
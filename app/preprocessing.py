@@ -0,0 +1,69 @@
+"""
+Model input preprocessing
+Turns decoded uint8 pixels into normalized float model inputs in a single vectorized pass
+"""
+
+import logging
+from functools import lru_cache
+from typing import Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Preprocessor:
+    """
+    Fused scale-and-normalize for uint8 RGB pixels.
+
+    ``(pixels / 255 - mean) / std`` is folded into one divide and one add
+    per channel, applied while moving channels first, straight into the
+    output array: no intermediate float copies, transposes or stacking.
+    Without ``mean`` and ``std`` the result equals ``transforms.ToTensor``.
+    """
+
+    def __init__(self, mean: Optional[Sequence[float]] = None, std: Optional[Sequence[float]] = None):
+        mean = np.zeros(3) if mean is None else np.asarray(mean, dtype=np.float64)
+        std = np.ones(3) if std is None else np.asarray(std, dtype=np.float64)
+        self.divisor = (255.0 * std).astype(np.float32).reshape(3, 1, 1)
+        self.offset = (-mean / std).astype(np.float32).reshape(3, 1, 1)
+        self.normalizes = bool(np.any(self.offset))
+
+    def into(self, pixels: np.ndarray, out: np.ndarray, channel_axis: int = -1) -> np.ndarray:
+        """
+        Preprocess uint8 pixels into ``out``.
+
+        Args:
+            pixels: [..., H, W, 3], or channel-first [..., 3, H, W] with ``channel_axis=-3``
+            out: float32 array of shape [..., 3, H, W], e.g. a slice of a preallocated batch
+        """
+        if channel_axis != -3:
+            pixels = np.moveaxis(pixels, channel_axis, -3)
+        np.divide(pixels, self.divisor, out=out)
+        if self.normalizes:
+            np.add(out, self.offset, out=out)
+        return out
+
+    def __call__(self, pixels: np.ndarray) -> np.ndarray:
+        """uint8 [H, W, 3] pixels to a float32 [3, H, W] input"""
+        height, width = pixels.shape[:2]
+        return self.into(pixels, np.empty((3, height, width), dtype=np.float32))
+
+    def batch(self, pixels_list: Sequence[np.ndarray], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Preprocess same-sized uint8 [H, W, 3] images straight into one
+        float32 [N, 3, H, W] batch, allocated once (or given as ``out``).
+        """
+        height, width = pixels_list[0].shape[:2]
+        if out is None:
+            out = np.empty((len(pixels_list), 3, height, width), dtype=np.float32)
+        for index, pixels in enumerate(pixels_list):
+            self.into(pixels, out[index])
+        return out
+
+
+@lru_cache(maxsize=None)
+def get_preprocessor(mean: Optional[tuple] = None, std: Optional[tuple] = None) -> Preprocessor:
+    """Shared preprocessor for a model configuration, built on first use."""
+    logger.info(f"Building preprocessor: mean={mean}, std={std}")
+    return Preprocessor(mean, std)
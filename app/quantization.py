@@ -0,0 +1,207 @@
+"""
+Post-training INT8 quantization for CPU inference
+"""
+
+import io
+import os
+import glob
+import time
+import logging
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# "none" keeps fp32, "dynamic" quantizes Linear weights, "static" quantizes convolutions and Linear layers
+MODEL_QUANTIZATION = os.environ.get("MODEL_QUANTIZATION", "none").lower()
+# Directory of sample patches used to calibrate activation ranges for static quantization
+QUANTIZATION_CALIBRATION_DIR = os.environ.get("QUANTIZATION_CALIBRATION_DIR", "")
+QUANTIZATION_CALIBRATION_SAMPLES = int(os.environ.get("QUANTIZATION_CALIBRATION_SAMPLES", "128"))
+# fbgemm for x86 (Lambda / ECS), qnnpack for ARM (Graviton)
+QUANTIZATION_BACKEND = os.environ.get("QUANTIZATION_BACKEND", "fbgemm")
+
+QUANTIZATION_MODES = ("none", "dynamic", "static")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def list_images(directory: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    Find images under a directory, with labels taken from the parent folder name.
+
+    Follows the dataset layout used in training (``.../0/*.png``, ``.../1/*.png``);
+    images whose parent folder is not a class number are returned unlabeled.
+    """
+    paths = []
+    for extension in IMAGE_EXTENSIONS:
+        paths.extend(glob.glob(os.path.join(directory, "**", f"*{extension}"), recursive=True))
+
+    images = []
+    for path in sorted(paths):
+        parent = os.path.basename(os.path.dirname(path))
+        images.append((path, int(parent) if parent.isdigit() else None))
+    return images
+
+
+def iter_image_batches(
+    images: List[Tuple[str, Optional[int]]],
+    preprocess: Callable[[Image.Image], torch.Tensor],
+    batch_size: int = 32
+) -> Iterator[Tuple[torch.Tensor, List[Optional[int]]]]:
+    """Yield (input batch, labels) pairs, skipping files that cannot be decoded."""
+    tensors, labels = [], []
+    for path, label in images:
+        try:
+            with Image.open(path) as image:
+                tensors.append(preprocess(image.convert("RGB")))
+            labels.append(label)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable image {path}: {e}")
+            continue
+        if len(tensors) == batch_size:
+            yield torch.stack(tensors), labels
+            tensors, labels = [], []
+    if tensors:
+        yield torch.stack(tensors), labels
+
+
+def quantize_dynamic_model(model: nn.Module) -> nn.Module:
+    """Quantize Linear weights to INT8; activations are quantized on the fly."""
+    torch.backends.quantized.engine = QUANTIZATION_BACKEND
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_model(
+    model: nn.Module,
+    example_input: torch.Tensor,
+    calibration_batches: Iterator[torch.Tensor]
+) -> nn.Module:
+    """
+    Statically quantize convolutions and Linear layers using calibrated activation ranges.
+
+    Uses FX graph mode so the model definitions do not need
+    QuantStub/DeQuantStub changes; Conv/BatchNorm/ReLU chains are fused
+    automatically.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = QUANTIZATION_BACKEND
+    model.eval()
+
+    prepared = prepare_fx(model, get_default_qconfig_mapping(QUANTIZATION_BACKEND), example_inputs=(example_input,))
+
+    calibrated = 0
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+            calibrated += batch.size(0)
+    logger.info(f"Calibrated static quantization on {calibrated} samples")
+
+    if calibrated == 0:
+        raise ValueError("No calibration samples available for static quantization")
+
+    return convert_fx(prepared)
+
+
+def quantize_model(
+    model: nn.Module,
+    mode: str,
+    example_input: torch.Tensor,
+    preprocess: Callable[[Image.Image], torch.Tensor],
+    calibration_dir: str = QUANTIZATION_CALIBRATION_DIR,
+    max_samples: int = QUANTIZATION_CALIBRATION_SAMPLES
+) -> nn.Module:
+    """
+    Produce an INT8 version of an eval-mode model.
+
+    Static quantization falls back to dynamic quantization when no
+    calibration images are available.
+    """
+    if mode == "none":
+        return model
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode} (expected one of {QUANTIZATION_MODES})")
+
+    if mode == "static":
+        images = list_images(calibration_dir)[:max_samples] if calibration_dir else []
+        if images:
+            logger.info(f"Static quantization with {len(images)} calibration images from {calibration_dir}")
+            batches = (batch for batch, _ in iter_image_batches(images, preprocess))
+            return quantize_static_model(model, example_input, batches)
+        logger.warning("No calibration images found, falling back to dynamic quantization")
+
+    logger.info("Applying dynamic INT8 quantization to Linear layers")
+    return quantize_dynamic_model(model)
+
+
+def model_size_bytes(model: nn.Module) -> int:
+    """Serialized size of a model's weights."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def compare_models(
+    reference: nn.Module,
+    candidate: nn.Module,
+    batches: List[Tuple[torch.Tensor, List[Optional[int]]]],
+    to_probabilities: Callable[[torch.Tensor], torch.Tensor],
+    repeats: int = 3
+) -> Dict[str, Dict[str, float]]:
+    """
+    Compare latency, weight size and accuracy of two models on the same batches.
+
+    Args:
+        reference: fp32 model
+        candidate: quantized model
+        batches: Held-out (input batch, labels) pairs
+        to_probabilities: Maps model output to malignant-class probabilities
+        repeats: Timed passes over the batches per model
+
+    Returns:
+        Metrics for each model plus prediction agreement between them
+    """
+    report = {}
+    probabilities = {}
+
+    for name, model in (("fp32", reference), ("int8", candidate)):
+        model.eval()
+        with torch.no_grad():
+            # Untimed pass for warmup and collecting predictions
+            probabilities[name] = torch.cat([to_probabilities(model(inputs)) for inputs, _ in batches])
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                for inputs, _ in batches:
+                    model(inputs)
+            elapsed = time.perf_counter() - start
+
+        samples = sum(inputs.size(0) for inputs, _ in batches)
+        report[name] = {
+            "latency_ms_per_image": elapsed / max(1, samples * repeats) * 1000,
+            "size_mb": model_size_bytes(model) / (1024 * 1024)
+        }
+
+    labels = [label for _, batch_labels in batches for label in batch_labels]
+    labeled = [index for index, label in enumerate(labels) if label is not None]
+    if labeled:
+        targets = torch.tensor([labels[index] for index in labeled])
+        for name in report:
+            predictions = (probabilities[name][labeled] > 0.5).long()
+            report[name]["accuracy"] = (predictions == targets).float().mean().item()
+
+    fp32_classes = probabilities["fp32"] > 0.5
+    int8_classes = probabilities["int8"] > 0.5
+    report["comparison"] = {
+        "samples": len(labels),
+        "labeled_samples": len(labeled),
+        "prediction_agreement": (fp32_classes == int8_classes).float().mean().item() if labels else 0.0,
+        "max_probability_diff": (probabilities["fp32"] - probabilities["int8"]).abs().max().item() if labels else 0.0,
+        "speedup": report["fp32"]["latency_ms_per_image"] / max(1e-9, report["int8"]["latency_ms_per_image"]),
+        "size_reduction": report["fp32"]["size_mb"] / max(1e-9, report["int8"]["size_mb"])
+    }
+    return report
@@ -0,0 +1,62 @@
+"""
+Request coalescing
+Concurrent requests for the same key share one computation instead of repeating it
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time.
+
+    The first caller for a key starts the computation; callers arriving
+    while it is in flight await the same result (or exception) instead of
+    starting their own. The computation runs as its own task, so a caller
+    that disconnects does not cancel it for the others. Nothing is kept
+    once it finishes; remembering results is the prediction cache's job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Return ``await func()``, sharing it with concurrent calls for ``key``."""
+        with self._lock:
+            self.calls += 1
+            task = self._in_flight.get(key)
+            if task is None:
+                self.executions += 1
+                task = asyncio.ensure_future(func())
+                self._in_flight[key] = task
+                task.add_done_callback(lambda _: self._forget(key, task))
+            else:
+                self.coalesced += 1
+                logger.info("Coalesced request with an identical one in flight")
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        with self._lock:
+            if self._in_flight.get(key) is task:
+                del self._in_flight[key]
+        # Retrieve the exception so an unawaited failure is not logged as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight)
+            }
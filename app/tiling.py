@@ -0,0 +1,393 @@
+"""
+Slide region tiling
+Scores a large histopathology region patch by patch and builds a probability heatmap
+"""
+
+import os
+import time
+import logging
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.image_utils import ImageProbe, ImageTooLargeError, decode_image, probe_image
+from app.tissue_filter import TISSUE_MIN_FRACTION, tissue_filter_stats, tissue_fraction
+from app.preprocessing import get_preprocessor
+
+logger = logging.getLogger(__name__)
+
+# Patch size in slide pixels; the IDC training patches are 50x50
+TILE_PATCH_SIZE = int(os.environ.get("TILE_PATCH_SIZE", "50"))
+# Distance between neighbouring patches in slide pixels (default: non-overlapping)
+TILE_STRIDE = int(os.environ.get("TILE_STRIDE", str(TILE_PATCH_SIZE)))
+# Patches per forward pass; bounds the size of every intermediate batch
+TILE_BATCH_SIZE = int(os.environ.get("TILE_BATCH_SIZE", "64"))
+# Largest region accepted, in pixels, both as uploaded and as scaled to model resolution;
+# checked from the header before the image is decoded
+TILE_MAX_PIXELS = int(os.environ.get("TILE_MAX_PIXELS", "16000000"))
+# Largest number of patches scored for one region
+TILE_MAX_TILES = int(os.environ.get("TILE_MAX_TILES", "10000"))
+# Coarse-to-fine mode: initial spacing of scored patches (power of two) and
+# the probability band whose blocks are refined
+TILE_ADAPTIVE = os.environ.get("TILE_ADAPTIVE", "false").lower() == "true"
+TILE_ADAPTIVE_COARSE_STEP = int(os.environ.get("TILE_ADAPTIVE_COARSE_STEP", "4"))
+TILE_ADAPTIVE_LOW = float(os.environ.get("TILE_ADAPTIVE_LOW", "0.2"))
+TILE_ADAPTIVE_HIGH = float(os.environ.get("TILE_ADAPTIVE_HIGH", "0.8"))
+# Score regions with the fully-convolutional model by default (PyTorch backend only)
+TILE_DENSE = os.environ.get("TILE_DENSE", "false").lower() == "true"
+
+MODEL_INPUT_SIZE = 64
+
+preprocessor = get_preprocessor()
+
+
+def tile_grid(height: int, width: int, window: int, stride: int) -> Tuple[int, int]:
+    """Number of patch rows and columns that fit entirely inside the region."""
+    if height < window or width < window:
+        return 0, 0
+    return (height - window) // stride + 1, (width - window) // stride + 1
+
+
+def scaled_region_size(width: int, height: int, patch_size: int) -> Tuple[int, int]:
+    """Size of a region scaled so one ``patch_size`` patch becomes one model input."""
+    scale = MODEL_INPUT_SIZE / patch_size
+    if scale == 1:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def probe_region(contents: bytes, filename: str, patch_size: int) -> Tuple[ImageProbe, Tuple[int, int]]:
+    """
+    Read a region's header and the size it will be scaled to, without decoding it.
+
+    Scaling by ``64 / patch_size`` enlarges regions cut into patches smaller
+    than the model input (with 8-pixel patches a 4000x4000 region becomes
+    32000x32000), so the pixel budget applies to the scaled size as well.
+
+    Raises:
+        ImageTooLargeError: If the region or its scaled copy exceeds TILE_MAX_PIXELS
+        ValueError: If the image cannot be opened
+    """
+    probe = probe_image(contents, filename, max_pixels=TILE_MAX_PIXELS)
+    width, height = probe.size
+    scaled_width, scaled_height = scaled_region_size(width, height, patch_size)
+    if scaled_width * scaled_height > TILE_MAX_PIXELS:
+        raise ImageTooLargeError(
+            f"Region too large: {width}x{height} scales to {scaled_width}x{scaled_height} for "
+            f"{patch_size}-pixel patches (maximum {TILE_MAX_PIXELS} pixels); use larger patches or a smaller region"
+        )
+    return probe, (scaled_width, scaled_height)
+
+
+def load_region(contents: bytes, filename: str, patch_size: int, probe: Optional[ImageProbe] = None,
+                scaled_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Decode a region and scale it so one patch matches the model input size.
+
+    The region is resized once instead of resizing every patch, which matches
+    per-patch resizing everywhere except within a pixel of patch borders.
+
+    Args:
+        probe: Result of ``probe_region`` for these bytes, with ``scaled_size``,
+            if the caller already probed them; the header is then not parsed again
+
+    Returns:
+        uint8 array of shape [H, W, 3]
+
+    Raises:
+        ValueError: If the image is too large or cannot be decoded
+    """
+    if probe is None:
+        # Reject oversized regions from the header alone, before any pixels are decoded
+        probe, scaled_size = probe_region(contents, filename, patch_size)
+
+    image = decode_image(contents, filename, probe=probe).image
+    if scaled_size != probe.size:
+        image = image.resize(scaled_size, Image.BILINEAR)
+    return np.array(image, dtype=np.uint8)
+
+
+def patch_windows(region: np.ndarray, window: int, stride: int) -> np.ndarray:
+    """[rows, cols, 3, window, window] view of every patch of the region, no copy."""
+    return np.lib.stride_tricks.sliding_window_view(region, (window, window), axis=(0, 1))[::stride, ::stride]
+
+
+def score_cells(predict_fn: Callable, windows: np.ndarray, cell_rows: np.ndarray, cell_cols: np.ndarray,
+                batch_size: int = TILE_BATCH_SIZE) -> Tuple[np.ndarray, int]:
+    """
+    Score the patches at the given grid cells in fixed-size batches.
+
+    Only one batch of patches is ever copied out of the region; it is
+    converted to float into one input buffer allocated for the whole call.
+    When the tissue filter is enabled, background patches get probability 0
+    without being sent to the model.
+
+    Args:
+        predict_fn: Maps a float32 array [B, 3, window, window] to B
+            probabilities; the array is reused for the next batch
+
+    Returns:
+        Probabilities, one per cell, and the number of background patches skipped
+    """
+    probs = np.zeros(len(cell_rows), dtype=np.float32)
+    skipped = 0
+    window = windows.shape[-1]
+    inputs = np.empty((min(batch_size, len(cell_rows)), 3, window, window), dtype=np.float32)
+    for start in range(0, len(cell_rows), batch_size):
+        stop = min(start + batch_size, len(cell_rows))
+        patches = windows[cell_rows[start:stop], cell_cols[start:stop]]
+        selected = np.arange(start, stop)
+        if TISSUE_MIN_FRACTION > 0:
+            keep = tissue_fraction(patches, channel_axis=1) >= TISSUE_MIN_FRACTION
+            skipped += int(len(keep) - keep.sum())
+            patches = patches[keep]
+            selected = selected[keep]
+        if len(selected):
+            batch = preprocessor.into(patches, inputs[:len(selected)], channel_axis=-3)
+            probs[selected] = np.asarray(predict_fn(batch), dtype=np.float32).reshape(-1)
+
+    if TISSUE_MIN_FRACTION > 0:
+        tissue_filter_stats.record(len(cell_rows), skipped)
+    return probs, skipped
+
+
+def score_region(predict_fn: Callable, region: np.ndarray, window: int, stride: int,
+                 batch_size: int = TILE_BATCH_SIZE) -> Tuple[np.ndarray, int]:
+    """
+    Run ``predict_fn`` over every patch of the region, in row-major order.
+
+    Returns:
+        Tuple of the probability heatmap, of shape [rows, cols], and the
+        number of background patches skipped by the tissue filter
+    """
+    rows, cols = tile_grid(region.shape[0], region.shape[1], window, stride)
+    indices = np.arange(rows * cols)
+    probs, skipped = score_cells(predict_fn, patch_windows(region, window, stride), indices // cols, indices % cols, batch_size)
+    return probs.reshape(rows, cols), skipped
+
+
+def dilate(mask: np.ndarray) -> np.ndarray:
+    """Cells with a True cell in their 8-neighbourhood, vectorized by shifting."""
+    padded = np.pad(mask, 1)
+    grown = np.zeros_like(mask)
+    for dr in (0, 1, 2):
+        for dc in (0, 1, 2):
+            grown |= padded[dr:dr + mask.shape[0], dc:dc + mask.shape[1]]
+    return grown
+
+
+def score_region_adaptive(predict_fn: Callable, region: np.ndarray, window: int, stride: int,
+                          batch_size: int = TILE_BATCH_SIZE, coarse_step: int = None,
+                          low: float = None, high: float = None) -> Tuple[np.ndarray, dict]:
+    """
+    Coarse-to-fine scoring of the patch grid.
+
+    Every ``coarse_step``-th patch in each direction is scored first and its
+    probability stands in for its whole block of patches. Blocks are then
+    split in half, level by level, but only where the block is uncertain
+    (``low <= p <= high``) or lies on the border between positive and
+    negative blocks. Clearly benign or background areas, and the interior of
+    positive areas, keep their coarse score.
+
+    Refinement never takes more forward passes than scoring every patch: a
+    level is only scored if every remaining patch could still be scored
+    afterwards within the exhaustive budget. Otherwise all remaining patches
+    are scored at once instead, e.g. when most of the region is uncertain.
+
+    Returns:
+        Probability heatmap of shape [rows, cols] and refinement statistics
+    """
+    if coarse_step is None:
+        coarse_step = TILE_ADAPTIVE_COARSE_STEP
+    low = TILE_ADAPTIVE_LOW if low is None else low
+    high = TILE_ADAPTIVE_HIGH if high is None else high
+    if coarse_step < 1 or coarse_step & (coarse_step - 1):
+        raise ValueError(f"Adaptive coarse step must be a power of two, got {coarse_step}")
+
+    rows, cols = tile_grid(region.shape[0], region.shape[1], window, stride)
+    windows = patch_windows(region, window, stride)
+    heatmap = np.zeros((rows, cols), dtype=np.float32)
+    scored = np.zeros((rows, cols), dtype=bool)
+    levels = []
+    total = rows * cols
+
+    def passes(patches: int) -> int:
+        return -(-patches // batch_size)
+
+    def forward_passes() -> int:
+        return sum(passes(level["patches"]) for level in levels)
+
+    def affordable(patches: int, final: bool) -> bool:
+        """Whether scoring ``patches`` more keeps refinement within the exhaustive budget."""
+        remaining = 0 if final else total - int(scored.sum()) - patches
+        return forward_passes() + passes(patches) + passes(remaining) <= passes(total)
+
+    def score_and_fill(cell_rows, cell_cols, block):
+        probs, skipped = score_cells(predict_fn, windows, cell_rows, cell_cols, batch_size)
+        scored[cell_rows, cell_cols] = True
+        for r, c, p in zip(cell_rows, cell_cols, probs):
+            heatmap[r:r + block, c:c + block] = p
+        levels.append({"block": block, "patches": int(len(cell_rows)), "background_skipped": skipped})
+
+    def score_remaining():
+        cell_rows, cell_cols = np.nonzero(~scored)
+        score_and_fill(cell_rows, cell_cols, 1)
+
+    # Coarse pass
+    grid_rows, grid_cols = np.meshgrid(np.arange(0, rows, coarse_step), np.arange(0, cols, coarse_step), indexing="ij")
+    exhaustive_fallback = not affordable(grid_rows.size, coarse_step == 1)
+    if exhaustive_fallback:
+        score_remaining()
+    else:
+        score_and_fill(grid_rows.ravel(), grid_cols.ravel(), coarse_step)
+
+    step = coarse_step
+    while step > 1 and not exhaustive_fallback:
+        # Block anchors at this level and their (filled) probabilities
+        anchors = heatmap[::step, ::step]
+        positive = anchors > 0.5
+
+        # Blocks on either side of a positive/negative boundary can hide the other class
+        boundary = (positive & dilate(~positive)) | (~positive & dilate(positive))
+        refine = ((anchors >= low) & (anchors <= high)) | boundary
+
+        half = step // 2
+        block_rows, block_cols = np.nonzero(refine)
+        child_rows = []
+        child_cols = []
+        # The anchor itself is included: it may only hold its parent's score
+        for dr, dc in ((0, 0), (0, half), (half, 0), (half, half)):
+            r = block_rows * step + dr
+            c = block_cols * step + dc
+            inside = (r < rows) & (c < cols)
+            child_rows.append(r[inside])
+            child_cols.append(c[inside])
+        child_rows = np.concatenate(child_rows)
+        child_cols = np.concatenate(child_cols)
+        # Cells already scored (e.g. refined twice through different rules) are not re-run
+        new = ~scored[child_rows, child_cols]
+        if not affordable(int(new.sum()), half == 1):
+            exhaustive_fallback = True
+            score_remaining()
+            break
+        score_and_fill(child_rows[new], child_cols[new], half)
+        step = half
+
+    patches_scored = int(scored.sum())
+    background_skipped = sum(level["background_skipped"] for level in levels)
+    return heatmap, {
+        "coarse_step": coarse_step,
+        "uncertainty_band": [low, high],
+        "levels": levels,
+        "exhaustive_fallback": exhaustive_fallback,
+        "patches_scored": patches_scored,
+        "patches_exhaustive": total,
+        "patches_saved": total - patches_scored,
+        "background_skipped": background_skipped,
+        "forward_passes": forward_passes(),
+        "forward_passes_exhaustive": passes(total),
+        "forward_passes_saved": passes(total) - forward_passes()
+    }
+
+
+def heatmap_stats(heatmap: np.ndarray, patch_size: int, stride: int, threshold: float = 0.5) -> dict:
+    """Aggregate statistics of a heatmap, with the hottest patch located in slide pixels."""
+    if heatmap.size == 0:
+        return {"tiles": 0}
+
+    positive = heatmap > threshold
+    row, col = np.unravel_index(int(np.argmax(heatmap)), heatmap.shape)
+    return {
+        "tiles": int(heatmap.size),
+        "positive_tiles": int(positive.sum()),
+        "positive_fraction": float(positive.mean()),
+        "mean_probability": float(heatmap.mean()),
+        "max_probability": float(heatmap[row, col]),
+        "max_location": {"row": int(row), "col": int(col), "x": int(col * stride), "y": int(row * stride),
+                         "size": patch_size}
+    }
+
+
+def predict_region(predict_fn: Callable, contents: bytes, filename: str,
+                   patch_size: int = TILE_PATCH_SIZE, stride: Optional[int] = None,
+                   batch_size: int = TILE_BATCH_SIZE, include_heatmap: bool = True,
+                   dense_scorer: Optional[Callable] = None, adaptive: bool = False,
+                   load_fn: Callable = load_region) -> dict:
+    """
+    Tile an uploaded region into patches, score them in fixed-size batches
+    and summarize the result.
+
+    With a ``dense_scorer`` (see app.dense_tiling) all windows are scored
+    from shared convolution features instead, and the stride is rounded to
+    the scorer's ``alignment``. With ``adaptive`` only uncertain areas are
+    scored at full resolution (see score_region_adaptive). ``load_fn``
+    decodes the region, e.g. in a worker process (see app.decode_pool); it
+    is called like ``load_region`` with the probe and scaled size.
+
+    Raises:
+        ValueError: For invalid tiling parameters or images
+    """
+    # TILE_STRIDE applies to the default patch size; custom patch sizes default to no overlap
+    if stride is None:
+        stride = TILE_STRIDE if patch_size == TILE_PATCH_SIZE else patch_size
+    if patch_size < 8 or stride <= 0:
+        raise ValueError(f"Invalid tiling: patch_size={patch_size}, stride={stride}")
+    if adaptive and dense_scorer is not None:
+        raise ValueError("Adaptive and dense scoring cannot be combined")
+
+    start = time.perf_counter()
+    # Pixel and patch budgets are enforced on the scaled region from the header,
+    # so nothing is decoded or allocated for a region that would be rejected
+    probe, (scaled_width, scaled_height) = probe_region(contents, filename, patch_size)
+
+    # Patch geometry in the scaled region
+    scale = MODEL_INPUT_SIZE / patch_size
+    scaled_stride = max(1, round(stride * scale))
+    if dense_scorer is not None:
+        alignment = dense_scorer.alignment
+        scaled_stride = max(alignment, round(scaled_stride / alignment) * alignment)
+    rows, cols = tile_grid(scaled_height, scaled_width, MODEL_INPUT_SIZE, scaled_stride)
+    if rows * cols == 0:
+        raise ValueError(f"Region is smaller than one {patch_size}x{patch_size} patch")
+    if rows * cols > TILE_MAX_TILES:
+        raise ValueError(f"Too many patches: {rows * cols} (maximum {TILE_MAX_TILES}); increase the stride")
+
+    # The header is parsed once, here; the loader decodes with the same probe
+    region = load_fn(contents, filename, patch_size, probe=probe, scaled_size=(scaled_width, scaled_height))
+    decoded = time.perf_counter()
+
+    dense_check = None
+    refinement = None
+    background_skipped = None
+    if dense_scorer is not None:
+        heatmap, dense_check = dense_scorer(region, MODEL_INPUT_SIZE, scaled_stride)
+    elif adaptive:
+        heatmap, refinement = score_region_adaptive(predict_fn, region, MODEL_INPUT_SIZE, scaled_stride, batch_size)
+    else:
+        heatmap, background_skipped = score_region(predict_fn, region, MODEL_INPUT_SIZE, scaled_stride, batch_size)
+    finished = time.perf_counter()
+    logger.info(f"Scored {rows}x{cols} patches of {filename} in {finished - decoded:.2f}s")
+
+    # Stride actually used, in slide pixels
+    stride = round(scaled_stride / scale, 2)
+    result = {
+        "mode": "dense" if dense_scorer is not None else "adaptive" if adaptive else "patches",
+        "patch_size": patch_size,
+        "stride": stride,
+        "grid": {"rows": rows, "cols": cols},
+        "stats": heatmap_stats(heatmap, patch_size, stride),
+        "timing_ms": {
+            "decode": (decoded - start) * 1000,
+            "inference": (finished - decoded) * 1000
+        }
+    }
+    if dense_check is not None:
+        result["dense_check"] = dense_check
+    if refinement is not None:
+        result["refinement"] = refinement
+    if background_skipped is not None and TISSUE_MIN_FRACTION > 0:
+        result["background_skipped"] = background_skipped
+    if include_heatmap:
+        result["heatmap"] = np.round(heatmap, 4).tolist()
+    return result
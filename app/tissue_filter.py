@@ -0,0 +1,147 @@
+"""
+Background and blank patch rejection
+Measures how much of a patch is stained tissue so empty slide glass can skip the model
+"""
+
+import os
+import threading
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.image_utils import decode_image
+
+logger = logging.getLogger(__name__)
+
+# Minimum fraction of tissue pixels for a patch to be scored by the model (0 disables the filter)
+TISSUE_MIN_FRACTION = float(os.environ.get("TISSUE_MIN_FRACTION", "0"))
+# Pixels brighter than this (mean of RGB) are treated as background glass
+TISSUE_WHITE_LEVEL = float(os.environ.get("TISSUE_WHITE_LEVEL", "220"))
+# Pixels darker than this (mean of RGB) are treated as empty or padding
+TISSUE_DARK_LEVEL = float(os.environ.get("TISSUE_DARK_LEVEL", "20"))
+# Minimum colour spread (max - min channel) of stained tissue; grey glass and dust have little
+TISSUE_MIN_CHROMA = float(os.environ.get("TISSUE_MIN_CHROMA", "15"))
+
+
+def tissue_mask(pixels: np.ndarray, channel_axis: int = -1) -> np.ndarray:
+    """
+    Per-pixel tissue mask for uint8 RGB pixels.
+
+    A pixel is tissue when it is neither near-white glass nor near-black
+    and has the colour spread of H&E staining.
+    """
+    pixels = pixels.astype(np.int16, copy=False)
+    brightness = pixels.sum(axis=channel_axis) / 3.0
+    chroma = pixels.max(axis=channel_axis) - pixels.min(axis=channel_axis)
+    return (brightness < TISSUE_WHITE_LEVEL) & (brightness > TISSUE_DARK_LEVEL) & (chroma >= TISSUE_MIN_CHROMA)
+
+
+def tissue_fraction(pixels: np.ndarray, channel_axis: int = -1) -> np.ndarray:
+    """
+    Fraction of tissue pixels per image.
+
+    Args:
+        pixels: uint8 array [H, W, 3] or a batch [B, H, W, 3]; use
+            ``channel_axis=1`` for channel-first batches [B, 3, H, W]
+
+    Returns:
+        Scalar array for one image, or shape [B] for a batch
+    """
+    mask = tissue_mask(pixels, channel_axis)
+    return mask.mean(axis=(-2, -1))
+
+
+def tissue_stats(pixels: np.ndarray) -> dict:
+    """Tissue statistics of one uint8 [H, W, 3] image, for API responses."""
+    fraction = float(tissue_fraction(pixels))
+    return {
+        "tissue_fraction": fraction,
+        "mean_intensity": float(pixels.mean()),
+        "is_tissue": fraction >= TISSUE_MIN_FRACTION
+    }
+
+
+class TissueFilterStats:
+    """Thread-safe counters of how much inference the filter skipped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    def record(self, checked: int, skipped: int):
+        with self._lock:
+            self.checked += checked
+            self.skipped += skipped
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": TISSUE_MIN_FRACTION > 0,
+                "min_tissue_fraction": TISSUE_MIN_FRACTION,
+                "patches_checked": self.checked,
+                "inference_skipped": self.skipped,
+                "skipped_fraction": self.skipped / self.checked if self.checked else 0.0
+            }
+
+
+tissue_filter_stats = TissueFilterStats()
+
+
+def check_tissue(pixels: np.ndarray):
+    """
+    Apply the filter to one decoded uint8 [H, W, 3] image and count the result.
+
+    Returns:
+        Tissue statistics, or None when the filter is disabled
+    """
+    if TISSUE_MIN_FRACTION <= 0:
+        return None
+    stats = tissue_stats(pixels)
+    tissue_filter_stats.record(1, 0 if stats["is_tissue"] else 1)
+    if not stats["is_tissue"]:
+        logger.info(f"Non-tissue image skipped: tissue fraction {stats['tissue_fraction']:.3f}")
+    return stats
+
+
+def filter_tissue(pixels: np.ndarray):
+    """
+    Apply the filter to decoded model-sized pixels.
+
+    Returns:
+        The pixels, or None when the image is rejected as background, and
+        tissue statistics (None when the filter is disabled)
+    """
+    tissue = check_tissue(pixels)
+    if tissue is not None and not tissue["is_tissue"]:
+        return None, tissue
+    return pixels, tissue
+
+
+def prepare_pixels(contents: bytes, filename: str, target_size: tuple) -> Tuple[Optional[np.ndarray], Optional[dict]]:
+    """
+    Decode an upload into ``target_size`` uint8 pixels and apply the tissue filter.
+
+    Returns:
+        The pixels and tissue statistics (None when the tissue filter is
+        disabled). The pixels are None when the filter rejects the image as
+        background, so the model does not need to run.
+
+    Raises:
+        ValueError: If the image cannot be decoded or is unsuitable for the model
+    """
+    # Open, decode, convert and resize in one pass; the resize matches
+    # transforms.Resize and leaves the pixels available to the tissue filter
+    pixels = decode_image(contents, filename, target_size=target_size).pixels
+    return filter_tissue(pixels)
+
+
+def non_tissue_result(tissue: dict) -> dict:
+    """Fast result returned for an image rejected by the filter, without running the model."""
+    return {
+        "prediction": 0,
+        "probability": 0.0,
+        "non_tissue": True,
+        "tissue": tissue
+    }
@@ -0,0 +1,86 @@
+"""
+Test-time augmentation (TTA)
+Scores the 8 flip/rotation views of each image in a single forward pass
+"""
+
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+# Rotations by 0/90/180/270 degrees, each with and without a horizontal flip
+TTA_VIEWS = 8
+
+
+def dihedral_views(batch: np.ndarray) -> np.ndarray:
+    """
+    Build every flip/rotation view of a batch of square images.
+
+    Args:
+        batch: Images of shape [N, C, H, W] with H == W
+
+    Returns:
+        Views of shape [N * 8, C, H, W]; the 8 views of each image are
+        adjacent, and the first view of each image is the original
+    """
+    rotations = [np.rot90(batch, k, axes=(2, 3)) for k in range(4)]
+    views = rotations + [np.flip(rotation, axis=3) for rotation in rotations]
+    return np.ascontiguousarray(np.stack(views, axis=1).reshape(-1, *batch.shape[1:]))
+
+
+def aggregate_views(probs: np.ndarray, views: int = TTA_VIEWS) -> List[dict]:
+    """
+    Summarize per-view probabilities for each image.
+
+    Args:
+        probs: Probabilities of shape [N * views], grouped as returned by dihedral_views
+
+    Returns:
+        One summary per image: mean, variance, range and the fraction of
+        views that agree with the class of the mean probability
+    """
+    per_image = np.asarray(probs, dtype=np.float64).reshape(-1, views)
+    mean = per_image.mean(axis=1)
+    variance = per_image.var(axis=1)
+    low = per_image.min(axis=1)
+    high = per_image.max(axis=1)
+    agreement = ((per_image > 0.5) == (mean > 0.5)[:, None]).mean(axis=1)
+
+    return [
+        {
+            "mean": float(mean[i]),
+            "variance": float(variance[i]),
+            "min": float(low[i]),
+            "max": float(high[i]),
+            "agreement": float(agreement[i]),
+            "view_probabilities": per_image[i].tolist()
+        }
+        for i in range(per_image.shape[0])
+    ]
+
+
+def predict_with_tta(predict_fn: Callable, batch: np.ndarray) -> Tuple[List[dict], dict]:
+    """
+    Run ``predict_fn`` once on all views of ``batch``.
+
+    Args:
+        predict_fn: Maps an array of shape [M, C, H, W] to M probabilities
+        batch: Images of shape [N, C, H, W]
+
+    Returns:
+        Per-image summaries and the timing of the augmented pass
+    """
+    start = time.perf_counter()
+    views = dihedral_views(batch)
+    augmented = time.perf_counter()
+    probs = predict_fn(views)
+    finished = time.perf_counter()
+
+    summaries = aggregate_views(np.asarray(probs))
+    timing = {
+        "views": TTA_VIEWS,
+        "batch_size": int(views.shape[0]),
+        "augment_ms": (augmented - start) * 1000,
+        "inference_ms": (finished - augmented) * 1000
+    }
+    return summaries, timing
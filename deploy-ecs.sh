@@ -30,7 +30,7 @@ echo "🐳 Step 2: Building and pushing Docker image..."
 aws ecr get-login-password --region $AWS_REGION | docker login --username AWS --password-stdin $ECR_URI
 
 # Build image
-docker build --platform linux/amd64 -t $SERVICE_NAME:$IMAGE_TAG ./ecs-pytorch-service/
+docker build --platform linux/amd64 -t $SERVICE_NAME:$IMAGE_TAG -f ecs-pytorch-service/Dockerfile .
 
 # Tag image
 docker tag $SERVICE_NAME:$IMAGE_TAG $ECR_URI:$IMAGE_TAG
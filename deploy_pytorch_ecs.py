@@ -52,7 +52,7 @@ def build_docker_image():
     ecr_uri = get_ecr_uri()
     
     # Build image
-    cmd = f"docker build -t {REPO_NAME}:{IMAGE_TAG} ./ecs-pytorch-service/"
+    cmd = f"docker build -t {REPO_NAME}:{IMAGE_TAG} -f ecs-pytorch-service/Dockerfile ."
     result = run_command(cmd)
     
     # Tag for ECR
@@ -0,0 +1,226 @@
+"""
+Dynamic micro-batching for the ECS inference service
+Gathers concurrent /predict/ requests into a single forward pass
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Batching configuration
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+
+# Number of recent requests kept for queue-wait percentiles
+STATS_WINDOW = 1000
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+class MicroBatcher:
+    """
+    Collects single-image tensors from concurrent requests and runs them
+    through the model as one batch.
+
+    A batch is flushed as soon as it holds ``max_batch_size`` items or the
+    oldest queued item has waited ``max_wait_ms``, whichever comes first.
+    The forward pass runs on a dedicated thread so the event loop keeps
+    accepting (and queueing) requests while a batch is being computed.
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[torch.Tensor], torch.Tensor],
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS
+    ):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+
+        # Statistics
+        self._batch_sizes = Counter()
+        self._flush_reasons = Counter()
+        self._queue_waits = deque(maxlen=STATS_WINDOW)
+        self._forward_times = deque(maxlen=STATS_WINDOW)
+        self._total_requests = 0
+        self._total_batches = 0
+        self._failed_batches = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self):
+        """Start the background batching loop on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Micro-batcher started: max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f}"
+        )
+
+    async def stop(self):
+        """Stop the batching loop and fail any requests still queued"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Batcher stopped"))
+
+        self._executor.shutdown(wait=False)
+        logger.info("Micro-batcher stopped")
+
+    async def submit(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Queue a single preprocessed image and wait for its model output.
+
+        Args:
+            image_tensor: Tensor of shape [1, C, H, W] or [C, H, W]
+
+        Returns:
+            The model output row for this image (batch dimension removed)
+        """
+        if not self.running:
+            raise RuntimeError("Batcher is not running")
+
+        if image_tensor.dim() == 4:
+            image_tensor = image_tensor.squeeze(0)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_tensor, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> Tuple[List[Tuple[torch.Tensor, asyncio.Future, float]], str]:
+        """Wait for the first item, then gather more until full or the deadline passes"""
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Take whatever is already waiting without sleeping
+                if self._queue.empty():
+                    return batch, "deadline"
+                batch.append(self._queue.get_nowait())
+                continue
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                return batch, "deadline"
+
+        return batch, "full"
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch, reason = await self._collect()
+
+            # Drop requests whose callers have already gone away
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            flush_time = time.perf_counter()
+            # Inputs that cannot be stacked together (e.g. a mismatched shape) get their
+            # own forward pass, so one malformed request only fails its own group
+            groups: Dict[tuple, list] = {}
+            for item in batch:
+                groups.setdefault((tuple(item[0].shape), item[0].dtype), []).append(item)
+
+            forward_time = 0.0
+            served = 0
+            for items in groups.values():
+                elapsed = await self._forward(loop, items)
+                if elapsed is None:
+                    continue
+                forward_time += elapsed
+                served += len(items)
+                for _, _, enqueued in items:
+                    self._queue_waits.append(flush_time - enqueued)
+            if not served:
+                continue
+
+            self._total_requests += served
+            self._total_batches += 1
+            self._batch_sizes[served] += 1
+            self._flush_reasons[reason] += 1
+            self._forward_times.append(forward_time)
+
+    async def _forward(self, loop, items: List[Tuple[torch.Tensor, asyncio.Future, float]]) -> Optional[float]:
+        """Run one forward pass and resolve the items' futures; returns its duration, or None if it failed"""
+        try:
+            tensors = torch.stack([item[0] for item in items])
+            start = time.perf_counter()
+            outputs = await loop.run_in_executor(self._executor, self.infer_fn, tensors)
+            forward_time = time.perf_counter() - start
+        except Exception as e:
+            logger.error(f"Batched inference failed for {len(items)} requests: {e}")
+            self._failed_batches += 1
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return None
+
+        for index, (_, future, _) in enumerate(items):
+            if not future.done():
+                future.set_result(outputs[index])
+        return forward_time
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait statistics for tuning latency vs throughput"""
+        waits = sorted(self._queue_waits)
+        forwards = list(self._forward_times)
+
+        return {
+            "running": self.running,
+            "config": {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000
+            },
+            "total_requests": self._total_requests,
+            "total_batches": self._total_batches,
+            "failed_batches": self._failed_batches,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "mean_batch_size": (self._total_requests / self._total_batches) if self._total_batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            "flush_reasons": dict(self._flush_reasons),
+            "queue_wait_ms": {
+                "p50": _percentile(waits, 50) * 1000,
+                "p95": _percentile(waits, 95) * 1000,
+                "p99": _percentile(waits, 99) * 1000,
+                "max": (waits[-1] * 1000) if waits else 0.0
+            },
+            "forward_ms": {
+                "mean": (sum(forwards) / len(forwards) * 1000) if forwards else 0.0,
+                "max": (max(forwards) * 1000) if forwards else 0.0
+            }
+        }
@@ -3,19 +3,42 @@ ECS PyTorch Inference Service
 Handles heavy ML inference workloads
 """
 import os
+import sys
+import time
 import logging
 import traceback
 from io import BytesIO
 from typing import Optional
 
+import numpy as np
 import torch
-import torchvision.transforms as transforms
 from PIL import Image
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
 import boto3
 from botocore.exceptions import ClientError
 
+# Modules shared with the Lambda API (compile_model, preprocessing, quantization) have a single source in app/.
+# The Docker build copies them next to this file; from a checkout they are imported there
+SHARED_MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "app")
+if os.path.isdir(SHARED_MODULES_DIR):
+    sys.path.append(SHARED_MODULES_DIR)
+
+from batching import MicroBatcher
+from compile_model import (
+    MODEL_COMPILE_MODE,
+    MODEL_WARMUP_BATCHES,
+    SAVE_COMPILED_MODEL,
+    compile_model,
+    compiled_model_path,
+    load_compiled_model,
+    save_compiled_model,
+    warmup_model,
+)
+from preprocessing import Preprocessor
+from quantization import MODEL_QUANTIZATION, quantize_model
+from result_cache import ResultCache, cache_key
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,6 +53,29 @@ app = FastAPI(
 # Global model variable
 model = None
 device = None
+batcher = None
+model_ready = False
+# Set by serve.py in forked worker processes
+worker_index = None
+# Identifies the loaded weights in result cache keys; None (random weights) disables caching
+model_version = None
+result_cache = ResultCache()
+
+MODEL_PATH = "/app/models/best_model.pth"
+MODEL_INPUT_SIZE = (224, 224)
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+# Built once; normalizes without per-request transform objects
+preprocessor = Preprocessor(IMAGENET_MEAN, IMAGENET_STD)
+
+# "auto" uses /app/models/best_model.safetensors when present, "pickle" always uses torch.load
+MODEL_WEIGHTS_FORMAT = os.getenv('MODEL_WEIGHTS_FORMAT', 'auto').lower()
+
+# Timings of the most recent model load, for comparing cold-start cost across formats
+model_load_metrics = {}
+
+# Set BATCHING_ENABLED=false to run one forward pass per request
+BATCHING_ENABLED = os.getenv('BATCHING_ENABLED', 'true').lower() == 'true'
 
 class BreastCancerCNN(torch.nn.Module):
     """CNN model for breast cancer detection"""
@@ -55,7 +101,7 @@ class BreastCancerCNN(torch.nn.Module):
         x = self.pool(torch.nn.functional.relu(self.conv3(x)))
         x = self.pool(torch.nn.functional.relu(self.conv4(x)))
         
-        x = x.view(x.size(0), -1)  # Flatten
+        x = torch.flatten(x, 1)  # Flatten (also valid for channels-last quantized outputs)
         x = torch.nn.functional.relu(self.fc1(x))
         x = self.dropout1(x)
         x = torch.nn.functional.relu(self.fc2(x))
@@ -63,24 +109,62 @@ class BreastCancerCNN(torch.nn.Module):
         x = self.fc3(x)
         return x
 
+def load_weights(target: torch.nn.Module, model_path: str) -> dict:
+    """
+    Load checkpoint weights, memory-mapping best_model.safetensors when available.
+
+    Memory-mapped tensors are adopted by the model without a copy, so pages
+    are read lazily and shared through the page cache between workers.
+    """
+    start = time.perf_counter()
+    mapped_path = f"{os.path.splitext(model_path)[0]}.safetensors"
+
+    if MODEL_WEIGHTS_FORMAT in ("auto", "safetensors") and os.path.exists(mapped_path):
+        try:
+            from safetensors.torch import load_file
+
+            state_dict = load_file(mapped_path)
+            try:
+                target.load_state_dict(state_dict, assign=True)
+            except TypeError:
+                # torch < 2.1 has no assign option
+                target.load_state_dict(state_dict)
+            return {
+                "format": "safetensors",
+                "path": mapped_path,
+                "size_mb": os.path.getsize(mapped_path) / (1024 * 1024),
+                "load_seconds": time.perf_counter() - start
+            }
+        except Exception as e:
+            logger.warning(f"Could not load {mapped_path}: {e}, loading pickle checkpoint")
+
+    target.load_state_dict(torch.load(model_path, map_location=device))
+    return {
+        "format": "pickle",
+        "path": model_path,
+        "size_mb": os.path.getsize(model_path) / (1024 * 1024),
+        "load_seconds": time.perf_counter() - start
+    }
+
+def checkpoint_version(model_path: str) -> str:
+    """Version of the checkpoint and of the settings that change its outputs"""
+    stat = os.stat(model_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{MODEL_QUANTIZATION}"
+
 def load_model():
     """Load the PyTorch model"""
-    global model, device
+    global model, device, model_ready, model_load_metrics, model_version
     
     try:
+        load_start = time.perf_counter()
+        model_ready = False
         device = torch.device('cpu')  # ECS uses CPU
         logger.info(f"Using device: {device}")
         
-        # Initialize model
-        model = BreastCancerCNN(num_classes=2)
-        
         # Try to load from S3 or local file
-        model_path = "/app/models/best_model.pth"
+        model_path = MODEL_PATH
         
-        if os.path.exists(model_path):
-            logger.info(f"Loading model from {model_path}")
-            model.load_state_dict(torch.load(model_path, map_location=device))
-        else:
+        if not os.path.exists(model_path):
             # Try to download from S3
             try:
                 s3_client = boto3.client('s3')
@@ -90,16 +174,63 @@ def load_model():
                 logger.info(f"Downloading model from S3: s3://{bucket_name}/{s3_key}")
                 os.makedirs("/app/models", exist_ok=True)
                 s3_client.download_file(bucket_name, s3_key, model_path)
-                
-                model.load_state_dict(torch.load(model_path, map_location=device))
-                logger.info("Model downloaded and loaded from S3")
+                logger.info("Model downloaded from S3")
                 
             except ClientError as e:
                 logger.warning(f"Could not load model from S3: {e}")
                 logger.info("Using randomly initialized model (for testing)")
         
-        model.eval()
-        logger.info("Model loaded successfully")
+        checkpoint_available = os.path.exists(model_path)
+        example_input = torch.zeros(1, 3, *MODEL_INPUT_SIZE)
+        loaded_model = None
+        load_metrics = {"format": "random_init"}
+        
+        # Reuse a previously compiled artifact when available
+        if MODEL_COMPILE_MODE != "none":
+            variant = MODEL_QUANTIZATION if MODEL_QUANTIZATION != "none" else ""
+            artifact_path = compiled_model_path(model_path, MODEL_COMPILE_MODE, variant)
+            if checkpoint_available:
+                loaded_model = load_compiled_model(artifact_path, model_path)
+                if loaded_model is not None:
+                    load_metrics = {
+                        "format": "torchscript",
+                        "path": artifact_path,
+                        "load_seconds": time.perf_counter() - load_start
+                    }
+        
+        if loaded_model is None:
+            # Initialize model
+            loaded_model = BreastCancerCNN(num_classes=2)
+            if checkpoint_available:
+                logger.info(f"Loading model from {model_path}")
+                load_metrics = load_weights(loaded_model, model_path)
+            loaded_model.eval()
+            
+            if MODEL_QUANTIZATION != "none":
+                loaded_model = quantize_model(
+                    loaded_model,
+                    MODEL_QUANTIZATION,
+                    example_input,
+                    lambda image: preprocess_image(image).squeeze(0)
+                )
+            
+            if MODEL_COMPILE_MODE != "none":
+                logger.info(f"Compiling model with mode: {MODEL_COMPILE_MODE}")
+                loaded_model = compile_model(loaded_model, MODEL_COMPILE_MODE, example_input)
+                # Never cache a compiled copy of randomly initialized weights
+                if SAVE_COMPILED_MODEL and checkpoint_available:
+                    save_compiled_model(loaded_model, artifact_path)
+        
+        model = loaded_model
+        model_version = checkpoint_version(model_path) if checkpoint_available else None
+        warmup_seconds = warmup_model(model, example_input, MODEL_WARMUP_BATCHES)
+        model_ready = True
+        model_load_metrics = {
+            **load_metrics,
+            "warmup_seconds": warmup_seconds,
+            "total_seconds": time.perf_counter() - load_start
+        }
+        logger.info(f"Model loaded successfully: {model_load_metrics}")
         return True
         
     except Exception as e:
@@ -108,28 +239,49 @@ def load_model():
         return False
 
 def preprocess_image(image: Image.Image):
-    """Preprocess image for model inference"""
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
-    
-    # Convert to RGB if needed
+    """Preprocess image for model inference: RGB, 224x224, ImageNet-normalized, batch of one"""
     if image.mode != 'RGB':
         image = image.convert('RGB')
-    
-    # Apply transforms
-    image_tensor = transform(image).unsqueeze(0)  # Add batch dimension
-    return image_tensor
+    # Bilinear, as transforms.Resize
+    size = (MODEL_INPUT_SIZE[1], MODEL_INPUT_SIZE[0])
+    if image.size != size:
+        image = image.resize(size, Image.BILINEAR)
+    return torch.from_numpy(preprocessor(np.asarray(image, dtype=np.uint8))).unsqueeze(0)
+
+def run_inference(batch: torch.Tensor) -> torch.Tensor:
+    """Run the model on a preprocessed batch and return class probabilities"""
+    with torch.no_grad():
+        outputs = model(batch)
+        return torch.nn.functional.softmax(outputs, dim=1)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize model on startup"""
     logger.info("Starting PyTorch Inference Service...")
-    success = load_model()
+    global batcher
+    if model is not None and model_ready:
+        # Preloaded by serve.py before this worker was forked
+        logger.info(f"Using model preloaded by the launcher (worker {worker_index}, pid {os.getpid()})")
+        warmup_model(model, torch.zeros(1, 3, *MODEL_INPUT_SIZE), MODEL_WARMUP_BATCHES)
+        success = True
+    else:
+        success = load_model()
     if not success:
         logger.error("Failed to load model during startup")
+        return
+    if BATCHING_ENABLED:
+        batcher = MicroBatcher(run_inference)
+        await batcher.start()
+    # Opened per worker, after fork; the file itself is shared
+    if model_version is not None:
+        result_cache.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the batching loop and flush the result cache"""
+    if batcher is not None:
+        await batcher.stop()
+    result_cache.stop()
 
 @app.get("/health")
 async def health_check():
@@ -140,8 +292,33 @@ async def health_check():
         "status": "healthy",
         "service": "pytorch-inference",
         "model_status": model_status,
+        "ready": model_ready,
+        "compile_mode": MODEL_COMPILE_MODE,
+        "quantization": MODEL_QUANTIZATION,
+        "model_load": model_load_metrics,
         "device": str(device) if device else "unknown",
-        "torch_version": torch.__version__
+        "torch_version": torch.__version__,
+        "batching": batcher is not None and batcher.running,
+        "worker": {"index": worker_index, "pid": os.getpid(), "torch_threads": torch.get_num_threads()}
+    })
+
+def process_memory():
+    """Resident and shared memory of this process in MB (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            _, resident, shared = (int(value) for value in f.read().split()[:3])
+        page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        return {"rss_mb": resident * page_mb, "shared_mb": shared * page_mb}
+    except (OSError, ValueError):
+        return {}
+
+@app.get("/metrics")
+async def metrics():
+    """Inference statistics for tuning the batching configuration"""
+    return JSONResponse({
+        "batching": batcher.stats() if batcher is not None else {"running": False},
+        "result_cache": result_cache.stats(),
+        "process": {"pid": os.getpid(), "worker_index": worker_index, **process_memory()}
     })
 
 @app.post("/predict/")
@@ -164,17 +341,27 @@ async def predict(file: UploadFile = File(...)):
         
         # Read and process image
         image_data = await file.read()
+        
+        # Results cached by any worker for the same bytes and model
+        key = cache_key(image_data, model_version) if model_version is not None else None
+        cached = result_cache.get(key) if key is not None else None
+        if cached is not None:
+            cached["image_info"]["filename"] = file.filename
+            cached["cached"] = True
+            return JSONResponse(cached)
+        
         image = Image.open(BytesIO(image_data))
         
         # Preprocess image
         image_tensor = preprocess_image(image)
         
-        # Perform inference
-        with torch.no_grad():
-            outputs = model(image_tensor)
-            probabilities = torch.nn.functional.softmax(outputs, dim=1)
-            predicted_class = torch.argmax(probabilities, dim=1).item()
-            confidence = probabilities[0][predicted_class].item()
+        # Perform inference, sharing a forward pass with concurrent requests when batching
+        if batcher is not None and batcher.running:
+            probabilities = (await batcher.submit(image_tensor)).unsqueeze(0)
+        else:
+            probabilities = run_inference(image_tensor)
+        predicted_class = torch.argmax(probabilities, dim=1).item()
+        confidence = probabilities[0][predicted_class].item()
         
         # Map prediction to class names
         class_names = {0: "benign", 1: "malignant"}
@@ -196,6 +383,8 @@ async def predict(file: UploadFile = File(...)):
         }
         
         logger.info(f"Prediction completed: {predicted_label} (confidence: {confidence:.3f})")
+        if key is not None:
+            result_cache.put(key, result)
         return JSONResponse(result)
         
     except Exception as e:
@@ -212,7 +401,7 @@ async def root():
     return {
         "message": "PyTorch Inference Service",
         "version": "1.0.0",
-        "endpoints": ["/health", "/predict/"],
+        "endpoints": ["/health", "/metrics", "/predict/"],
         "status": "running"
     }
 
@@ -0,0 +1,223 @@
+"""
+Persistent prediction cache for the ECS inference service
+Shares results between worker processes and across worker restarts through one SQLite file
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# SQLite file shared by all workers of the task (empty disables the cache)
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', '/tmp/prediction-cache.sqlite3')
+# Maximum cached results; the least recently used are evicted beyond this
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '50000'))
+# Seconds between batched writes of new results and access times
+RESULT_CACHE_FLUSH_INTERVAL = float(os.getenv('RESULT_CACHE_FLUSH_INTERVAL', '0.5'))
+
+# Eviction removes this much more than the overflow so it does not run on every flush
+EVICTION_SLACK = 0.1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed);
+"""
+
+
+def cache_key(contents: bytes, model_version: str) -> str:
+    """SHA-256 of the image bytes combined with the version of the model that scored them."""
+    return f"{hashlib.sha256(contents).hexdigest()}:{model_version}"
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    # WAL lets readers in every worker proceed while one worker commits
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ResultCache:
+    """
+    Prediction results in a SQLite file shared by every worker process.
+
+    Lookups are single indexed reads on the request path. New results and
+    the access times of hits are queued in memory and written by a
+    background thread in one transaction every ``flush_interval`` seconds,
+    so workers contend for the write lock a few times per second at most,
+    never once per request. Rows beyond ``max_entries`` are evicted least
+    recently used first during a flush.
+
+    Each process opens its own connections in ``start()``, which must run
+    after fork (in the worker's startup event). The file outlives workers,
+    so a restarted worker starts with everything its predecessors cached.
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 flush_interval: float = RESULT_CACHE_FLUSH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._reader: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+        # Statistics (this worker only)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.written = 0
+        self.evicted = 0
+        self.flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None and self._writer.is_alive()
+
+    def start(self) -> bool:
+        """Open the shared file and start the writer thread; returns False if the cache is unavailable"""
+        if not self.path or self.max_entries <= 0 or self.running:
+            return self.running
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            writer = _connect(self.path)
+            writer.executescript(SCHEMA)
+            self._reader = _connect(self.path)
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache disabled, cannot open {self.path}: {e}")
+            return False
+
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._run, args=(writer,), name="result-cache-writer", daemon=True)
+        self._writer.start()
+        logger.info(f"Result cache opened: {self.path} (max_entries={self.max_entries})")
+        return True
+
+    def stop(self):
+        """Flush queued writes and close the cache"""
+        if not self.running:
+            return
+        self._stop.set()
+        self._writer.join(timeout=5.0)
+        self._writer = None
+        with self._read_lock:
+            self._reader.close()
+            self._reader = None
+
+    def get(self, key: str) -> Optional[dict]:
+        """Cached result for ``key``, or None"""
+        if not self.running:
+            return None
+        try:
+            with self._read_lock:
+                row = self._reader.execute("SELECT result FROM predictions WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Result cache read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Refresh the access time with the next batched write
+        self._pending.put((key, None, time.time()))
+        return json.loads(row[0])
+
+    def put(self, key: str, result: dict):
+        """Queue a result to be written with the next flush"""
+        if self.running:
+            self._pending.put((key, json.dumps(result), time.time()))
+
+    def _run(self, conn: sqlite3.Connection):
+        try:
+            while not self._stop.wait(self.flush_interval):
+                self._flush(conn)
+            self._flush(conn)
+        finally:
+            conn.close()
+
+    def _flush(self, conn: sqlite3.Connection):
+        results, touched = {}, {}
+        while True:
+            try:
+                key, result, accessed = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if result is None:
+                touched[key] = accessed
+            else:
+                results[key] = (result, accessed)
+        if not results and not touched:
+            return
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, result, accessed) VALUES (?, ?, ?)",
+                [(key, result, accessed) for key, (result, accessed) in results.items()]
+            )
+            conn.executemany(
+                "UPDATE predictions SET accessed = max(accessed, ?) WHERE key = ?",
+                [(accessed, key) for key, accessed in touched.items()]
+            )
+            evicted = 0
+            if results:
+                count = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+                if count > self.max_entries:
+                    excess = count - self.max_entries + int(self.max_entries * EVICTION_SLACK)
+                    evicted = conn.execute(
+                        "DELETE FROM predictions WHERE key IN "
+                        "(SELECT key FROM predictions ORDER BY accessed LIMIT ?)",
+                        (excess,)
+                    ).rowcount
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Result cache flush failed, dropping {len(results)} results: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            return
+
+        self.flushes += 1
+        self.written += len(results)
+        self.evicted += evicted
+
+    def stats(self) -> dict:
+        entries = None
+        if self.running:
+            try:
+                with self._read_lock:
+                    entries = self._reader.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.running,
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "pending_writes": self._pending.qsize(),
+            "written": self.written,
+            "evicted": self.evicted,
+            "flushes": self.flushes,
+            "errors": self.errors
+        }
@@ -0,0 +1,195 @@
+"""
+Production launcher for the ECS PyTorch Inference Service
+Loads the model once, then forks workers that share its weights
+"""
+import gc
+import logging
+import math
+import os
+import signal
+import socket
+import sys
+import time
+
+import torch
+import uvicorn
+
+import main
+
+logger = logging.getLogger("serve")
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '8080'))
+BACKLOG = int(os.getenv('BACKLOG', '2048'))
+# Seconds to wait before restarting a worker that exited
+WORKER_RESTART_DELAY = float(os.getenv('WORKER_RESTART_DELAY', '1'))
+# Seconds to wait for workers to exit on shutdown
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv('WORKER_SHUTDOWN_TIMEOUT', '20'))
+
+
+def available_cpus() -> int:
+    """CPUs available to this container, honouring the cgroup CPU quota set by ECS."""
+    # cgroup v2
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def create_socket(host: str, port: int) -> socket.socket:
+    """Listening socket created once in the parent and inherited by every worker."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Launcher:
+    """Forks and supervises uvicorn worker processes."""
+
+    def __init__(self, workers: int, threads_per_worker: int):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.children = {}  # pid -> worker index
+        self.shutting_down = False
+        self.sock = None
+
+    def spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            self.run_worker(index)  # never returns
+        self.children[pid] = index
+        logger.info(f"Started worker {index} (pid {pid})")
+
+    def run_worker(self, index: int):
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            torch.set_num_threads(self.threads_per_worker)
+            main.worker_index = index
+
+            config = uvicorn.Config(main.app, log_level=os.getenv('LOG_LEVEL', 'info'))
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except Exception as e:
+            logger.error(f"Worker {index} crashed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def stop(self, signum, frame):
+        if self.shutting_down:
+            return
+        self.shutting_down = True
+        logger.info(f"Received signal {signum}, stopping {len(self.children)} workers")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def kill_remaining(self):
+        """SIGKILL each worker still running after the shutdown timeout, once, and reap it."""
+        for pid, index in list(self.children.items()):
+            logger.warning(f"Worker {index} (pid {pid}) did not stop within {WORKER_SHUTDOWN_TIMEOUT}s, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            del self.children[pid]
+
+    def run(self):
+        # Load (and warm up) once, single-threaded so no intra-op thread pool exists at fork time
+        torch.set_num_threads(1)
+        if not main.load_model():
+            logger.error("Failed to load model in launcher")
+            sys.exit(1)
+
+        # Keep the garbage collector from touching (and un-sharing) objects created so far
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+
+        self.sock = create_socket(HOST, PORT)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        logger.info(
+            f"Serving on {HOST}:{PORT} with {self.workers} workers, "
+            f"{self.threads_per_worker} torch threads each"
+        )
+        for index in range(self.workers):
+            self.spawn(index)
+
+        deadline = None
+        while self.children:
+            if self.shutting_down and deadline is None:
+                deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+
+            if pid == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    self.kill_remaining()
+                    continue
+                time.sleep(0.2)
+                continue
+
+            index = self.children.pop(pid, None)
+            if index is None:
+                continue
+            # Recycle workers that die while the service is running
+            if not self.shutting_down:
+                logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+                time.sleep(WORKER_RESTART_DELAY)
+                self.spawn(index)
+            else:
+                logger.info(f"Worker {index} (pid {pid}) stopped")
+
+        self.sock.close()
+        logger.info("All workers stopped")
+
+
+def main_entry():
+    logging.basicConfig(level=logging.INFO)
+
+    cpus = available_cpus()
+    workers = int(os.getenv('ECS_WORKERS', str(cpus)))
+    workers = max(1, workers)
+    default_threads = max(1, cpus // workers)
+    threads_per_worker = int(os.getenv('TORCH_THREADS_PER_WORKER', str(default_threads)))
+
+    logger.info(f"Detected {cpus} available CPUs")
+    Launcher(workers, threads_per_worker).run()
+
+
+if __name__ == "__main__":
+    main_entry()
@@ -0,0 +1,134 @@
+"""
+Export the trained model weights for torch-free inference and fast loading
+
+Formats:
+    onnx - ONNX graph for the onnxruntime backend (models/best_model.onnx)
+    npz  - NumPy arrays of the state dict for the numpy backend (models/best_model.npz)
+    safetensors - memory-mapped weights for fast PyTorch cold starts (models/best_model.safetensors)
+
+Example:
+    python export_model.py --format onnx
+    python export_model.py --format safetensors --checkpoint ecs-pytorch-service/models/best_model.pth
+"""
+
+import argparse
+import inspect
+import os
+
+import numpy as np
+import torch
+
+from app.model import SimpleCNN
+
+INPUT_SIZE = (64, 64)
+# Largest logit difference from PyTorch accepted for an exported model
+PARITY_TOLERANCE = 1e-4
+
+
+def load_checkpoint(checkpoint):
+    model = SimpleCNN()
+    model.load_state_dict(torch.load(checkpoint, map_location=torch.device('cpu')))
+    model.eval()
+    return model
+
+
+def check_parity(output, expected, output_path):
+    """Delete the export and raise if its outputs differ from PyTorch's by more than PARITY_TOLERANCE."""
+    difference = float(np.abs(output - expected).max())
+    print(f"Max logit difference vs PyTorch: {difference:.2e}")
+    if not difference <= PARITY_TOLERANCE:
+        os.remove(output_path)
+        raise ValueError(
+            f"Export does not match PyTorch: max logit difference {difference:.2e} "
+            f"exceeds {PARITY_TOLERANCE:.0e}; removed {output_path}"
+        )
+
+
+def export_onnx(model, output_path, opset=17):
+    """Export to ONNX with a dynamic batch dimension and check parity with onnxruntime."""
+    example_input = torch.zeros(1, 3, *INPUT_SIZE)
+    export_kwargs = {}
+    # Newer torch versions default to the dynamo exporter, which needs onnxscript
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    torch.onnx.export(
+        model,
+        example_input,
+        output_path,
+        input_names=["input"],
+        output_names=["logit"],
+        dynamic_axes={"input": {0: "batch"}, "logit": {0: "batch"}},
+        opset_version=opset,
+        **export_kwargs
+    )
+    print(f"ONNX model written to {output_path} ({os.path.getsize(output_path) / 1024:.1f} KB)")
+
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        print("onnxruntime not installed, skipping parity check")
+        return
+
+    session = ort.InferenceSession(output_path, providers=["CPUExecutionProvider"])
+    check_input = np.random.rand(4, 3, *INPUT_SIZE).astype(np.float32)
+    onnx_output = session.run(None, {"input": check_input})[0]
+    with torch.no_grad():
+        torch_output = model(torch.from_numpy(check_input)).numpy()
+    check_parity(onnx_output, torch_output, output_path)
+
+
+def export_npz(model, output_path):
+    """Save the state dict as NumPy arrays and check parity with the NumPy engine."""
+    state = {name: tensor.detach().cpu().numpy() for name, tensor in model.state_dict().items()}
+    np.savez(output_path, **state)
+    print(f"NumPy weights written to {output_path} ({os.path.getsize(output_path) / 1024:.1f} KB)")
+
+    from app.numpy_model import NumpySimpleCNN
+
+    engine = NumpySimpleCNN(output_path)
+    check_input = np.random.rand(4, 3, *INPUT_SIZE).astype(np.float32)
+    with torch.no_grad():
+        torch_output = model(torch.from_numpy(check_input)).numpy()
+    check_parity(engine(check_input), torch_output, output_path)
+
+
+def export_safetensors(state_dict, output_path):
+    """Save a state dict in the zero-copy safetensors format and check it round-trips."""
+    from safetensors.torch import load_file, save_file
+
+    save_file({name: tensor.contiguous() for name, tensor in state_dict.items()}, output_path)
+    print(f"safetensors weights written to {output_path} ({os.path.getsize(output_path) / 1024:.1f} KB)")
+
+    loaded = load_file(output_path)
+    mismatched = [name for name, tensor in state_dict.items() if not torch.equal(tensor, loaded[name])]
+    if mismatched:
+        os.remove(output_path)
+        raise ValueError(f"Round-trip mismatch for: {mismatched}; removed {output_path}")
+    print(f"Verified {len(loaded)} tensors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export model weights for torch-free inference and fast loading")
+    parser.add_argument("--format", choices=["onnx", "npz", "safetensors"], default="onnx", help="Export format")
+    parser.add_argument("--checkpoint", default="models/best_model.pth", help="PyTorch state dict")
+    parser.add_argument("--output", help="Output path (defaults to the checkpoint path with the format's extension)")
+    args = parser.parse_args()
+
+    output_path = args.output or f"{os.path.splitext(args.checkpoint)[0]}.{args.format}"
+
+    if args.format == "safetensors":
+        # Any state dict can be converted, including the ECS BreastCancerCNN checkpoint
+        export_safetensors(torch.load(args.checkpoint, map_location=torch.device('cpu')), output_path)
+        return
+
+    model = load_checkpoint(args.checkpoint)
+
+    if args.format == "onnx":
+        export_onnx(model, output_path)
+    elif args.format == "npz":
+        export_npz(model, output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare an INT8 quantized model against the fp32 model on a held-out set
+
+Reports latency, weight size and accuracy for both models. Held-out images
+are labeled by their parent folder (0 = benign, 1 = malignant), the same
+layout used for training.
+
+Example:
+    python quantization_report.py --model simple --mode static \
+        --calibration-dir data/calibration --holdout-dir data/holdout
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+
+import torch
+
+
+def load_simple_cnn(checkpoint):
+    from app.load_model import model_transform
+    from app.model import SimpleCNN
+
+    model = SimpleCNN()
+    model.load_state_dict(torch.load(checkpoint, map_location=torch.device('cpu')))
+    model.eval()
+    return model, model_transform(), (64, 64), torch.sigmoid
+
+
+def load_breast_cancer_cnn(checkpoint):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ecs-pytorch-service"))
+    from main import BreastCancerCNN, preprocess_image
+
+    model = BreastCancerCNN(num_classes=2)
+    model.load_state_dict(torch.load(checkpoint, map_location=torch.device('cpu')))
+    model.eval()
+    preprocess = lambda image: preprocess_image(image).squeeze(0)
+    to_probabilities = lambda outputs: torch.softmax(outputs, dim=1)[:, 1]
+    return model, preprocess, (224, 224), to_probabilities
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare INT8 quantized and fp32 models")
+    parser.add_argument("--model", choices=["simple", "breast"], default="simple",
+                        help="simple = SimpleCNN (Lambda), breast = BreastCancerCNN (ECS)")
+    parser.add_argument("--checkpoint", default="models/best_model.pth", help="fp32 state dict")
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="dynamic", help="Quantization mode")
+    parser.add_argument("--calibration-dir", default="", help="Sample patches for static quantization")
+    parser.add_argument("--holdout-dir", required=True, help="Held-out images in 0/ and 1/ folders")
+    parser.add_argument("--max-samples", type=int, default=1000, help="Maximum held-out images")
+    parser.add_argument("--output", help="Optional path to write the JSON report")
+    args = parser.parse_args()
+
+    from app.quantization import iter_image_batches, list_images, quantize_model, compare_models
+    if args.model == "simple":
+        model, preprocess, input_size, to_probabilities = load_simple_cnn(args.checkpoint)
+    else:
+        model, preprocess, input_size, to_probabilities = load_breast_cancer_cnn(args.checkpoint)
+
+    print(f"Quantizing {args.model} model with mode: {args.mode}")
+    example_input = torch.zeros(1, 3, *input_size)
+    quantized = quantize_model(copy.deepcopy(model), args.mode, example_input, preprocess, args.calibration_dir)
+
+    images = list_images(args.holdout_dir)[:args.max_samples]
+    if not images:
+        print(f"No held-out images found in {args.holdout_dir}")
+        return False
+    print(f"Evaluating on {len(images)} held-out images")
+    batches = list(iter_image_batches(images, preprocess))
+
+    report = compare_models(model, quantized, batches, to_probabilities)
+    report["config"] = {"model": args.model, "mode": args.mode, "checkpoint": args.checkpoint}
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Parity test for reduced-resolution decoding of large uploads against full-resolution decoding
+"""
+
+import io
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.image_utils import decode_image, resize_to_pixels
+from app.model import SimpleCNN
+
+TARGET_SIZE = (64, 64)
+
+
+def _stained_image(width, height, seed=0):
+    """Smooth H&E-like colour field with fine texture, so every scale has detail"""
+    rng = np.random.RandomState(seed)
+    coarse = rng.rand(height // 64 + 2, width // 64 + 2, 3)
+    field = np.array(Image.fromarray((coarse * 255).astype(np.uint8)).resize((width, height), Image.BICUBIC))
+    texture = rng.randint(-20, 21, size=(height, width, 1))
+    return Image.fromarray(np.clip(field * [0.6, 0.35, 0.7] + 60 + texture, 0, 255).astype(np.uint8))
+
+
+def _encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **({"quality": 90} if image_format == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def _full_resolution_pixels(data):
+    """Model input as produced before reduced decoding: full decode, then bilinear resize"""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return resize_to_pixels(image.convert("RGB"), TARGET_SIZE)
+
+
+def test_draft_decode_parity():
+    """Reduced decoding should barely change model inputs and predictions of large uploads"""
+    torch.manual_seed(0)
+    model = SimpleCNN().eval()
+
+    cases = [
+        ("JPEG", 4000, 3000),
+        ("JPEG", 2048, 2048),
+        ("PNG", 3000, 2000),  # no reduced decoding: identical
+        ("JPEG", 200, 150),  # too small to reduce
+    ]
+    full_inputs, reduced_inputs = [], []
+    for seed, (image_format, width, height) in enumerate(cases):
+        data = _encode(_stained_image(width, height, seed), image_format)
+        full = _full_resolution_pixels(data)
+        decoded = decode_image(data, target_size=TARGET_SIZE)
+
+        pixel_diff = np.abs(full.astype(int) - decoded.pixels.astype(int))
+        assert decoded.source_size == (width, height)
+        assert decoded.pixels.shape == (TARGET_SIZE[1], TARGET_SIZE[0], 3)
+        assert pixel_diff.mean() < 1.0
+        assert pixel_diff.max() <= 4
+        if image_format != "JPEG" or decoded.image.size == (width, height):
+            assert pixel_diff.max() == 0
+        full_inputs.append(full)
+        reduced_inputs.append(decoded.pixels)
+
+    def probabilities(pixels):
+        batch = torch.from_numpy(np.stack(pixels)).permute(0, 3, 1, 2).float().div_(255.0)
+        with torch.no_grad():
+            return torch.sigmoid(model(batch)).reshape(-1).numpy()
+
+    prob_diff = np.abs(probabilities(full_inputs) - probabilities(reduced_inputs))
+    assert prob_diff.max() < 1e-2
+
+    # Large JPEGs must actually be decoded at reduced resolution
+    large = decode_image(_encode(_stained_image(4000, 3000), "JPEG"), target_size=TARGET_SIZE)
+    assert large.image.size[0] < 4000 and large.image.size[1] < 3000
+
+
+if __name__ == "__main__":
+    test_draft_decode_parity()
@@ -0,0 +1,53 @@
+"""
+Parity test for the pure-NumPy SimpleCNN engine against the PyTorch model
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import torch
+
+from app.model import SimpleCNN
+from app.numpy_model import NumpySimpleCNN
+
+
+def _random_trained_model():
+    """SimpleCNN with non-trivial BatchNorm statistics, as after training"""
+    torch.manual_seed(0)
+    model = SimpleCNN()
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.2, 0.2)
+    model.eval()
+    return model
+
+
+def test_numpy_model_parity():
+    """NumPy logits and predictions should match PyTorch on a batch of images"""
+    model = _random_trained_model()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        weights_path = os.path.join(temp_dir, "best_model.npz")
+        np.savez(weights_path, **{name: t.numpy() for name, t in model.state_dict().items()})
+        engine = NumpySimpleCNN(weights_path)
+
+    batch = np.random.RandomState(0).rand(8, 3, 64, 64).astype(np.float32)
+    numpy_logits = engine(batch)
+    with torch.no_grad():
+        torch_logits = model(torch.from_numpy(batch)).numpy()
+
+    assert numpy_logits.shape == (8,)
+    assert np.abs(numpy_logits - torch_logits).max() < 1e-4
+    assert np.array_equal(numpy_logits > 0, torch_logits > 0)
+
+    # A single image must give the same result as its row in the batch
+    single_logit = engine(batch[:1])
+    assert np.abs(single_logit - numpy_logits[:1]).max() < 1e-5
+
+
+if __name__ == "__main__":
+    test_numpy_model_parity()